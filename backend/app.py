@@ -1,37 +1,70 @@
 """
 Python代码执行可视化工具 - Flask API服务器
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_socketio import SocketIO
 from flask_cors import CORS
+import hashlib
+import logging
 import os
 import sys
 
+import orjson
+
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from websocket_handler import setup_websocket_handlers, execution_manager
+from websocket_handler import ORJSONPacketCodec, setup_websocket_handlers, execution_manager
 from examples import get_examples as get_example_list
+from ast_parser import ASTParser
+
+logger = logging.getLogger(__name__)
+
+class ORJSONProvider(JSONProvider):
+    """使用orjson序列化JSON，直接输出bytes"""
+
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option), mimetype='application/json')
 
 # 创建Flask应用
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = 'python_visualizer_secret_key_2024'
 
 # 启用CORS支持React前端
 CORS(app, origins=["http://localhost:3001"])
 
 # 创建SocketIO实例，允许React前端连接
-socketio = SocketIO(app, cors_allowed_origins=["http://localhost:3001"])
+socketio = SocketIO(app, cors_allowed_origins=["http://localhost:3001"], json=ORJSONPacketCodec)
 
 # 设置WebSocket处理器
 setup_websocket_handlers(socketio)
 
+# 内置示例的源代码固定，启动时预先解析分析
+ASTParser.preload(example['code'] for example in get_example_list())
+
+# 示例是静态数据，启动时序列化一次并计算ETag
+_EXAMPLES_JSON = orjson.dumps(get_example_list(), default=dict)  # 示例是只读映射，按字典序列化
+_EXAMPLES_ETAG = hashlib.sha256(_EXAMPLES_JSON).hexdigest()
+
 @app.route('/api/examples')
 def get_examples():
-    """获取示例代码"""
+    """获取示例代码（客户端缓存未过期时返回304）"""
     # 使用新的动画演示示例
-    examples = get_example_list()
-    return jsonify(examples)
+    response = Response(_EXAMPLES_JSON, mimetype='application/json')
+    response.set_etag(_EXAMPLES_ETAG)
+    response.headers['Cache-Control'] = 'public, max-age=3600, immutable'
+    return response.make_conditional(request)
 
 @app.route('/api/parse', methods=['POST'])
 def parse_code():
@@ -39,16 +72,20 @@ def parse_code():
     data = request.json
     source_code = data.get('source_code', '')
     inputs = data.get('inputs', '')
+    fast_mode = bool(data.get('fast_mode', False))
+    native_code = bool(data.get('native_code', False))
+    instrumented = bool(data.get('instrumented', False))
 
-    print(f"Parsing code: {len(source_code)} characters")
-    result = execution_manager.parse_code(source_code, inputs)
-    print(f"Parse result: success={result.get('success')}")
+    logger.debug("Parsing code: %d characters", len(source_code))
+    result = execution_manager.parse_code(source_code, inputs, fast_mode=fast_mode, native_code=native_code,
+                                          instrumented=instrumented)
+    logger.debug("Parse result: success=%s", result.get('success'))
 
     # 如果解析成功，自动开始执行
     if result.get('success'):
-        print("Code parsed successfully, starting execution automatically...")
+        logger.debug("Code parsed successfully, starting execution automatically...")
         execution_result = execution_manager.start_execution(step_mode=False)
-        print(f"Execution start result: {execution_result}")
+        logger.debug("Execution start result: %s", execution_result)
         result['execution_started'] = execution_result.get('success', False)
 
     return jsonify(result)
@@ -73,6 +110,8 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
+    # 调试日志（执行钩子等）默认关闭，可通过 LOG_LEVEL=DEBUG 打开
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING'))
     print("Starting Python Code Visualizer...")
     print("Server will be available at: http://localhost:3002")
 
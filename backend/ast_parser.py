@@ -2,22 +2,266 @@
 AST解析器 - 将Python代码解析为抽象语法树并提供执行钩子
 """
 import ast
-from typing import Dict, List, Any, Optional
-import json
+import hashlib
+import logging
+import re
+import sys
+import threading
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Any, Optional, Tuple
+
+# 解析缓存：sha256(源代码) -> (AST, 分析器, 行数)，重复提交相同代码时跳过解析和分析；
+# 解释器挂在节点上的编译结果（_thunk、_anim_template 等）随AST一起被复用
+PARSE_CACHE_SIZE = 128
+PARSE_CACHE_MAX_SOURCE = 1_000_000  # 超过该长度的源代码不缓存
+_parse_cache: "OrderedDict[str, Tuple[ast.Module, Any, int]]" = OrderedDict()
+_parse_cache_lock = threading.Lock()
+_pinned_parses: Dict[str, Tuple[ast.Module, Any, int]] = {}  # 启动时预先分析的固定源代码（内置示例），不参与淘汰
+_code_cache: "OrderedDict[str, Any]" = OrderedDict()  # sha256(源代码) -> 字节码对象
+
+USER_CODE_FILENAME = '<user_code>'  # 编译用户代码时使用的文件名
+VIS_HOOK_NAME = '__vis_hook__'  # 插桩代码中记录步骤的回调函数名
+# 插桩模式中记录步骤的语句类型（与解释器记录步骤的节点类型一致）
+INSTRUMENTED_STATEMENTS = frozenset({
+    ast.Assign, ast.AugAssign, ast.AnnAssign, ast.If, ast.For, ast.While, ast.FunctionDef, ast.ClassDef,
+    ast.Return, ast.Expr
+})
+# 与ast的行号一致的换行符（str.splitlines 还会在 \x0c、\x85、\u2028 等字符处断行）
+_LINE_BREAK = re.compile(r'\r\n?|\n')
+SENT_ANIMATIONS_LIMIT = 4096  # 动画去重记录的最大条数
+
+logger = logging.getLogger(__name__)
+
+@dataclass(slots=True)
+class IterCtx:
+    """循环上下文（遍历栈中的一层）"""
+    container: str
+    iterator_var: str
+    line: int
+    current_index: int = -1  # 还没开始遍历
+    level: int = 0  # 嵌套级别
+    pattern: str = 'simple'  # 'simple' 或 'dual_pointer'
+    multi_indices: dict = field(default_factory=dict)  # 用于存储多个索引访问 {container_name: [indices]}
+
+def _value_digest(value: Any) -> Any:
+    """动画去重用的值摘要：容器只取类型、长度和身份，避免把大对象转成字符串"""
+    if value is None or isinstance(value, (int, float, str, bool)):
+        return value
+    if isinstance(value, (list, dict, tuple, set)):
+        return (type(value).__name__, len(value), id(value))
+    return (type(value).__name__, id(value))
+
+def _fast_docstring(node: ast.AST) -> Optional[str]:
+    """取函数/类的原始文档字符串（仅用于展示，不做缩进清理）"""
+    body0 = node.body[0] if node.body else None
+    if (isinstance(body0, ast.Expr) and isinstance(body0.value, ast.Constant)
+            and isinstance(body0.value.value, str)):
+        return body0.value.value
+    return None
+
+def source_digest(source_code: str) -> str:
+    """计算源代码的缓存键"""
+    return hashlib.sha256(source_code.encode()).hexdigest()
+
+def compile_source(source_code: str, tree: ast.Module = None):
+    """将源代码编译为CPython字节码（快速模式使用），按源代码哈希缓存"""
+    return _cached_code(source_digest(source_code), len(source_code),
+                        lambda: compile(tree if tree is not None else source_code, USER_CODE_FILENAME, 'exec'))
+
+def compile_instrumented(source_code: str):
+    """将源代码插桩后编译为字节码（插桩模式使用），按源代码哈希缓存"""
+    def build():
+        # 重新解析一份AST再改写，解析缓存中共享的AST保持不变
+        tree = InstrumentationTransformer().visit(ast.parse(source_code))
+        return compile(ast.fix_missing_locations(tree), USER_CODE_FILENAME, 'exec')
+    return _cached_code('instrumented:' + source_digest(source_code), len(source_code), build)
+
+def _cached_code(key: str, source_length: int, build):
+    """按键查找字节码缓存，未命中时调用 build() 编译并缓存"""
+    with _parse_cache_lock:
+        code = _code_cache.get(key)
+        if code is not None:
+            _code_cache.move_to_end(key)
+            return code
+
+    code = build()
+    if source_length < PARSE_CACHE_MAX_SOURCE:
+        with _parse_cache_lock:
+            _code_cache[key] = code
+            if len(_code_cache) > PARSE_CACHE_SIZE:
+                _code_cache.popitem(last=False)
+    return code
+
+class InstrumentationTransformer(ast.NodeTransformer):
+    """在每条需要记录的语句前插入 __vis_hook__(行号, 节点类型) 调用；
+    循环体开头另插入 __vis_hook__(行号, None)，只检查停止和暂停，循环体只有 pass/break/continue 时也能停止"""
+
+    def generic_visit(self, node: ast.AST) -> ast.AST:
+        super().generic_visit(node)
+        for field_name in ('body', 'orelse', 'finalbody'):
+            statements = getattr(node, field_name, None)
+            if isinstance(statements, list) and statements and isinstance(statements[0], ast.stmt):
+                setattr(node, field_name, self._instrument(statements))
+        if type(node) in (ast.For, ast.While):
+            check_call = ast.Call(ast.Name(VIS_HOOK_NAME, ast.Load()), [ast.Constant(node.lineno), ast.Constant(None)], [])
+            node.body.insert(0, ast.copy_location(ast.Expr(check_call), node))
+        return node
+
+    @staticmethod
+    def _instrument(statements: List[ast.stmt]) -> List[ast.stmt]:
+        result = []
+        for index, stmt in enumerate(statements):
+            node_type = type(stmt)
+            # 文档字符串和 from __future__ 导入必须保持在最前面
+            is_docstring = (index == 0 and node_type is ast.Expr and isinstance(stmt.value, ast.Constant)
+                            and isinstance(stmt.value.value, str))
+            if node_type in INSTRUMENTED_STATEMENTS and not is_docstring:
+                hook_call = ast.Call(ast.Name(VIS_HOOK_NAME, ast.Load()),
+                                     [ast.Constant(stmt.lineno), ast.Constant(node_type.__name__)], [])
+                result.append(ast.copy_location(ast.Expr(hook_call), stmt))
+            result.append(stmt)
+        return result
+
+def _attribute_name(node: ast.Attribute) -> Optional[str]:
+    """obj.attr 返回 "obj.attr"，对象部分没有变量名时返回None"""
+    base_name = variable_name(node.value)
+    return f"{base_name}.{node.attr}" if base_name else None
+
+# 节点类型 -> 变量名提取函数；obj[key] 取 obj 的变量名
+_NAME_EXTRACTORS = {
+    ast.Name: lambda node: node.id,
+    ast.Attribute: _attribute_name,
+    ast.Subscript: lambda node: variable_name(node.value),
+}
+
+def variable_name(node: ast.AST) -> Optional[str]:
+    """从AST节点中提取变量名，不支持的节点返回None"""
+    extract = _NAME_EXTRACTORS.get(type(node))
+    return extract(node) if extract is not None else None
+
+# 产生动画的列表方法和字典方法
+_LIST_ANIMATION_METHODS = frozenset({'append', 'insert', 'extend'})
+_DICT_ANIMATION_METHODS = frozenset({'update', 'setdefault'})
+
+def assignment_animation_template(node: ast.Assign) -> Tuple[Optional[Dict[str, Any]], Optional[tuple]]:
+    """构建赋值动画模板，返回 (模板, 动画标识符)：只有 obj[key] = 变量 的形式才有动画，否则模板为None"""
+    # 检查是否是从变量赋值
+    if type(node.value) is not ast.Name:
+        return None, None
+
+    # 检查目标是否是下标赋值 (obj[key] = var)
+    for target in node.targets:
+        if type(target) is ast.Subscript:
+            target_obj = variable_name(target.value)
+            if target_obj:
+                template = {
+                    'type': 'value_transfer',
+                    'operation': 'assignment',
+                    'source_variable': node.value.id,
+                    'source_value': None,
+                    'target_variable': target_obj,
+                    'line': node.lineno,
+                    'animation_type': 'assignment_operation',
+                    'step_count': None  # 执行时填入步骤计数
+                }
+                # 创建动画标识符，防止同一行重复录制
+                return template, (node.lineno, 'assignment', node.value.id, target_obj)
+    return None, None
+
+def call_animation_template(node: ast.Call) -> Tuple[Optional[Dict[str, Any]], Optional[tuple]]:
+    """构建方法调用的动画模板，返回 (模板, 候选来源参数)；没有动画时模板为None"""
+    # 检测方法调用，如 list.append(var)
+    if type(node.func) is not ast.Attribute or not node.args:
+        return None, None
+    attr_name = node.func.attr
+
+    # 检测 list/array 操作
+    if attr_name in _LIST_ANIMATION_METHODS:
+        # 获取目标对象名（如 list_name）
+        target_obj = variable_name(node.func.value)
+        if not target_obj:
+            return None, None
+
+        sources = []
+        for arg in node.args:
+            # AST节点类型没有子类，按类型身份比较即可
+            arg_type = type(arg)
+            if arg_type is ast.Name:
+                sources.append(('name', arg.id, arg))
+            elif arg_type is ast.Constant:
+                sources.append(('constant', None, arg))
+            elif arg_type is ast.Subscript and type(arg.value) is ast.Name:
+                sources.append(('subscript', arg.value.id, arg))
+        if not sources:
+            return None, None
+
+        template = {
+            'type': 'value_transfer',
+            'operation': attr_name,
+            'source_variable': None,
+            'source_value': None,
+            'target_variable': target_obj,
+            'line': node.lineno,
+            'animation_type': 'list_operation',
+            'step_count': None  # 执行时填入步骤计数
+        }
+        return template, tuple(sources)
+
+    # 检测字典操作等其他方法调用
+    if attr_name in _DICT_ANIMATION_METHODS:
+        target_obj = variable_name(node.func.value)
+        if target_obj:
+            template = {
+                'type': 'value_transfer',
+                'operation': attr_name,
+                'target_variable': target_obj,
+                'line': node.lineno,
+                'animation_type': 'dict_operation',
+                'step_count': None  # 执行时填入步骤计数
+            }
+            return template, None
+
+    return None, None
 
 class ExecutionHook:
     """执行钩子类，用于在AST节点执行时记录状态"""
 
+    __slots__ = (
+        'steps', 'current_line', 'variables', 'call_stack', 'step_count', 'emit_callback',
+        'sent_animations', '_sent_animation_order', 'iteration_stack', '_iter_by_var', '_iter_by_container',
+        '_iter_version', '_iter_snapshot',
+    )
+
     def __init__(self):
         self.steps = []
         self.current_line = 1
-        self.variables = {}
-        self.call_stack = []
+        self.variables = {}  # 只读变量表，更新时整体替换
+        self.call_stack: Tuple[str, ...] = ()  # 不可变调用栈，压栈/出栈都生成新元组，快照无需复制
         self.step_count = 0
         self.emit_callback = None  # 用于实时发送步骤的回调函数
         self.sent_animations = set()  # 用于追踪已发送的动画，防止重复
-        self.loop_contexts = []  # 循环上下文栈，用于追踪嵌套循环
-        self.iteration_stack = []  # 遍历状态栈，支持嵌套循环 [{container: str, index: int, iterator_var: str}]
+        self._sent_animation_order = deque()  # 按发送顺序记录，超出上限时淘汰最旧的记录
+        self.iteration_stack: List[IterCtx] = []  # 遍历状态栈，支持嵌套循环
+        self._iter_by_var = {}  # 迭代变量 -> 该变量的循环上下文栈（最内层在末尾）
+        self._iter_by_container = {}  # 容器名 -> 遍历该容器的循环上下文（按入栈顺序）
+        # 写时复制快照：状态未变化时多个步骤共享同一个快照对象（快照按约定只读）
+        self._iter_version = 0
+        self._iter_snapshot = (-1, None)
+
+    def _variables_snapshot(self, variables: Dict = None) -> Dict:
+        """获取变量快照；变量表按约定只读，直接持有而不再复制"""
+        return variables if variables else self.variables
+
+    def _call_stack_snapshot(self, call_stack: Tuple[str, ...] = None) -> Tuple[str, ...]:
+        """获取调用栈快照；调用栈是元组，直接持有"""
+        return call_stack if call_stack else self.call_stack
+
+    def _iteration_snapshot(self) -> List[Dict]:
+        """获取遍历栈快照，遍历栈变化后才重新序列化为字典"""
+        if self._iter_snapshot[0] != self._iter_version:
+            self._iter_snapshot = (self._iter_version, [asdict(ctx) for ctx in self.iteration_stack])
+        return self._iter_snapshot[1]
 
     def record_step(self, node_type: str, line_number: int, description: str,
                    variables: Dict = None, call_stack: List = None):
@@ -25,10 +269,10 @@ class ExecutionHook:
         step = {
             'step': self.step_count,
             'line': line_number,
-            'node_type': node_type,
+            'node_type': sys.intern(node_type),  # 节点类型种类很少，驻留后所有步骤共享同一字符串
             'description': description,
-            'variables': dict(variables) if variables else dict(self.variables),
-            'call_stack': list(call_stack) if call_stack else list(self.call_stack),
+            'variables': self._variables_snapshot(variables),
+            'call_stack': self._call_stack_snapshot(call_stack),
             'timestamp': self.step_count  # 简化的时间戳
         }
         self.steps.append(step)
@@ -49,27 +293,36 @@ class ExecutionHook:
             animation_data.get('operation'),
             animation_data.get('source_variable'),
             animation_data.get('target_variable'),
-            str(animation_data.get('source_value')),
+            _value_digest(animation_data.get('source_value')),
             animation_data.get('step_count', self.step_count)  # 添加步骤计数确保唯一性
         )
 
-        print(f"🎬 [Debug] Animation key: {animation_key}")
-        print(f"🎬 [Debug] Sent animations count: {len(self.sent_animations)}")
+        debug = logger.isEnabledFor(logging.DEBUG)  # 每个动画都经过这里，关闭调试日志时不构造日志参数
+        if debug:
+            logger.debug("🎬 [Debug] Animation key: %s", animation_key)
+            logger.debug("🎬 [Debug] Sent animations count: %d", len(self.sent_animations))
 
         # 检查是否已经发送过相同的动画
         if animation_key in self.sent_animations:
-            print(f"🎬 [Animation] Skipping duplicate animation: {animation_data.get('operation')} (key exists)")
+            if debug:
+                logger.debug("🎬 [Animation] Skipping duplicate animation: %s (key exists)", animation_data.get('operation'))
             return
 
         # 记录已发送的动画
         self.sent_animations.add(animation_key)
-        print(f"🎬 [Animation] Added to sent_animations, new count: {len(self.sent_animations)}")
+        self._sent_animation_order.append(animation_key)
+        if len(self._sent_animation_order) > SENT_ANIMATIONS_LIMIT:
+            self.sent_animations.discard(self._sent_animation_order.popleft())
+        if debug:
+            logger.debug("🎬 [Animation] Added to sent_animations, new count: %d", len(self.sent_animations))
 
         # 将动画数据添加到当前步骤中
         if self.steps:
             # 添加到最近的步骤
             self.steps[-1]['animation'] = animation_data
-            print(f"🎬 [Animation] Recorded animation for {animation_data.get('operation')}: {animation_data.get('source_variable')} -> {animation_data.get('target_variable')}")
+            if debug:
+                logger.debug("🎬 [Animation] Recorded animation for %s: %s -> %s", animation_data.get('operation'),
+                             animation_data.get('source_variable'), animation_data.get('target_variable'))
 
             # 如果设置了回调函数，实时发送动画步骤
             if self.emit_callback:
@@ -79,8 +332,8 @@ class ExecutionHook:
                     'line': animation_data.get('line'),
                     'node_type': 'Animation',
                     'description': f"Animation: {animation_data.get('operation')}",
-                    'variables': dict(self.variables),
-                    'call_stack': list(self.call_stack),
+                    'variables': self._variables_snapshot(),
+                    'call_stack': self._call_stack_snapshot(),
                     'animation': animation_data,
                     'timestamp': self.step_count
                 }
@@ -88,40 +341,49 @@ class ExecutionHook:
 
     def push_iteration_context(self, container_name: str, iterator_var: str, line: int, pattern: str = 'simple'):
         """开始新的循环上下文"""
-        context = {
-            'container': container_name,
-            'iterator_var': iterator_var,
-            'line': line,
-            'current_index': -1,  # 还没开始遍历
-            'level': len(self.iteration_stack),  # 嵌套级别
-            'pattern': pattern,  # 'simple' 或 'dual_pointer'
-            'multi_indices': {}  # 用于存储多个索引访问 {container_name: [indices]}
-        }
+        context = IterCtx(sys.intern(container_name), sys.intern(iterator_var), line,
+                          level=len(self.iteration_stack), pattern=sys.intern(pattern))
         self.iteration_stack.append(context)
-        print(f"🔄 [Loop Start] Pushed loop context: {iterator_var} in {container_name} (level {context['level']}, pattern: {pattern})")
+        self._iter_by_var.setdefault(iterator_var, []).append(context)
+        self._iter_by_container.setdefault(container_name, []).append(context)
+        self._iter_version += 1
+        logger.debug("🔄 [Loop Start] Pushed loop context: %s in %s (level %d, pattern: %s)",
+                     iterator_var, container_name, context.level, pattern)
+
+    def get_iteration_context(self, iterator_var: str) -> Optional[IterCtx]:
+        """按迭代变量查找最内层的循环上下文"""
+        contexts = self._iter_by_var.get(iterator_var)
+        return contexts[-1] if contexts else None
+
+    def get_container_contexts(self, container_name: str) -> List[IterCtx]:
+        """按容器名查找正在遍历它的所有循环上下文（外层在前，调用方不应修改返回的列表）"""
+        return self._iter_by_container.get(container_name, [])
 
     def update_iteration_index(self, iterator_var: str, current_index: int):
         """更新当前循环的索引"""
         # 找到匹配的循环上下文并更新索引
-        for context in reversed(self.iteration_stack):
-            if context['iterator_var'] == iterator_var:
-                context['current_index'] = current_index
-                print(f"🔄 [Iteration] Updated {iterator_var}[{current_index}] in {context['container']} (level {context['level']})")
-
-                # 发送更新的遍历状态
-                if self.emit_callback:
-                    iteration_event = {
-                        'step': self.step_count,
-                        'line': self.current_line,
-                        'node_type': 'Iteration',
-                        'description': f"Iterating {iterator_var} in {context['container']}[{current_index}]",
-                        'variables': {},  # 将在interpreter中填充
-                        'call_stack': list(self.call_stack),
-                        'iteration_stack': [ctx.copy() for ctx in self.iteration_stack],  # 发送整个栈
-                        'timestamp': self.step_count
-                    }
-                    self.emit_callback(iteration_event)
-                break
+        context = self.get_iteration_context(iterator_var)
+        if context is None:
+            return
+
+        context.current_index = current_index
+        self._iter_version += 1
+        logger.debug("🔄 [Iteration] Updated %s[%s] in %s (level %d)",
+                     iterator_var, current_index, context.container, context.level)
+
+        # 发送更新的遍历状态
+        if self.emit_callback:
+            iteration_event = {
+                'step': self.step_count,
+                'line': self.current_line,
+                'node_type': 'Iteration',
+                'description': f"Iterating {iterator_var} in {context.container}[{current_index}]",
+                'variables': {},  # 将在interpreter中填充
+                'call_stack': self._call_stack_snapshot(),
+                'iteration_stack': self._iteration_snapshot(),  # 发送整个栈
+                'timestamp': self.step_count
+            }
+            self.emit_callback(iteration_event)
 
     def record_multi_index_access(self, container_name: str, indices: List[int], index_vars: List[str]):
         """记录同一容器的多个索引访问（双指针模式）"""
@@ -130,13 +392,15 @@ class ExecutionHook:
 
         # 找到当前最顶层的上下文并记录多索引访问
         current_context = self.iteration_stack[-1]
-        current_context['multi_indices'][container_name] = {
+        current_context.multi_indices[container_name] = {
             'indices': indices.copy(),
             'index_vars': index_vars.copy(),
             'type': 'multi_index'
         }
+        self._iter_version += 1
 
-        print(f"🔄 [Multi-Index] Recording {container_name} indices: {dict(zip(index_vars, indices))}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔄 [Multi-Index] Recording %s indices: %s", container_name, dict(zip(index_vars, indices)))
 
         # 发送多索引访问事件
         if self.emit_callback:
@@ -146,8 +410,8 @@ class ExecutionHook:
                 'node_type': 'MultiIndex',
                 'description': f"Multi-index access: {container_name}{indices}",
                 'variables': {},  # 将在interpreter中填充
-                'call_stack': list(self.call_stack),
-                'iteration_stack': [ctx.copy() for ctx in self.iteration_stack],
+                'call_stack': self._call_stack_snapshot(),
+                'iteration_stack': self._iteration_snapshot(),
                 'timestamp': self.step_count
             }
             self.emit_callback(multi_index_event)
@@ -159,15 +423,17 @@ class ExecutionHook:
 
         # 找到当前最顶层的上下文并记录切片访问
         current_context = self.iteration_stack[-1]
-        current_context['multi_indices'][container_name] = {
+        current_context.multi_indices[container_name] = {
             'start_index': start_idx,
             'end_index': end_idx,
             'start_var': start_var,
             'end_var': end_var,
             'type': 'slice_range'
         }
+        self._iter_version += 1
 
-        print(f"🔄 [Slice] Recording {container_name}[{start_idx}:{end_idx}] range: {start_var}={start_idx}, {end_var}={end_idx}")
+        logger.debug("🔄 [Slice] Recording %s[%s:%s] range: %s=%s, %s=%s",
+                     container_name, start_idx, end_idx, start_var, start_idx, end_var, end_idx)
 
         # 发送切片访问事件
         if self.emit_callback:
@@ -177,72 +443,123 @@ class ExecutionHook:
                 'node_type': 'SliceRange',
                 'description': f"Slice range access: {container_name}[{start_idx}:{end_idx}]",
                 'variables': {},  # 将在interpreter中填充
-                'call_stack': list(self.call_stack),
-                'iteration_stack': [ctx.copy() for ctx in self.iteration_stack],
+                'call_stack': self._call_stack_snapshot(),
+                'iteration_stack': self._iteration_snapshot(),
                 'timestamp': self.step_count
             }
             self.emit_callback(slice_event)
 
     def pop_iteration_context(self, iterator_var: str):
         """结束循环上下文"""
-        # 从栈顶开始查找匹配的上下文
-        for i in range(len(self.iteration_stack) - 1, -1, -1):
-            if self.iteration_stack[i]['iterator_var'] == iterator_var:
-                removed_context = self.iteration_stack.pop(i)
-                print(f"🔄 [Loop End] Popped loop context: {iterator_var} (level {removed_context['level']})")
-
-                # 发送循环结束事件
-                if self.emit_callback:
-                    end_event = {
-                        'step': self.step_count,
-                        'line': self.current_line,
-                        'node_type': 'IterationEnd',
-                        'description': f"Loop ended: {iterator_var}",
-                        'variables': {},
-                        'call_stack': list(self.call_stack),
-                        'iteration_stack': [ctx.copy() for ctx in self.iteration_stack],  # 发送剩余的栈
-                        'timestamp': self.step_count
-                    }
-                    self.emit_callback(end_event)
-                break
+        # 通过索引找到该变量最内层的上下文
+        contexts = self._iter_by_var.get(iterator_var)
+        if not contexts:
+            return
+
+        removed_context = contexts[-1]
+        if self.iteration_stack[-1] is removed_context:
+            # 正常嵌套时出栈的总是栈顶
+            self.iteration_stack.pop()
+            self._forget_iteration_context(removed_context)
+        else:
+            # 栈顶不匹配（内层循环未正常结束），连同内层上下文一起展开
+            depth = self.iteration_stack.index(removed_context)
+            for context in self.iteration_stack[depth:]:
+                self._forget_iteration_context(context)
+            del self.iteration_stack[depth:]
+        self._iter_version += 1
+        logger.debug("🔄 [Loop End] Popped loop context: %s (level %d)", iterator_var, removed_context.level)
+
+        # 发送循环结束事件
+        if self.emit_callback:
+            end_event = {
+                'step': self.step_count,
+                'line': self.current_line,
+                'node_type': 'IterationEnd',
+                'description': f"Loop ended: {iterator_var}",
+                'variables': {},
+                'call_stack': self._call_stack_snapshot(),
+                'iteration_stack': self._iteration_snapshot(),  # 发送剩余的栈
+                'timestamp': self.step_count
+            }
+            self.emit_callback(end_event)
+
+    def _forget_iteration_context(self, context: IterCtx):
+        """从迭代变量和容器索引中移除上下文"""
+        for index, key in ((self._iter_by_var, context.iterator_var), (self._iter_by_container, context.container)):
+            contexts = index[key]
+            if contexts[-1] is context:
+                contexts.pop()
+            else:
+                contexts.remove(context)
+            if not contexts:
+                del index[key]
 
     def get_iteration_stack(self):
         """获取当前迭代栈的副本"""
-        return [ctx.copy() for ctx in self.iteration_stack]
+        return self._iteration_snapshot()
 
     def clear_all_iteration_contexts(self):
         """清除所有循环上下文（用于重置）"""
         self.iteration_stack.clear()
-        print("🔄 [Reset] Cleared all iteration contexts")
+        self._iter_by_var.clear()
+        self._iter_by_container.clear()
+        self._iter_version += 1
+        logger.debug("🔄 [Reset] Cleared all iteration contexts")
 
-class IndexAccessAnalyzer(ast.NodeVisitor):
+class IndexAccessAnalyzer:
     """分析循环体内的索引访问模式"""
 
-    def __init__(self, index_var_name: str):
-        self.index_var_name = index_var_name
-        self.container_accesses = []  # 存储 container[index] 的访问
+    _LEAF_TYPES = (ast.Name, ast.Constant, ast.expr_context)
 
-    def visit_Subscript(self, node):
+    def __init__(self, index_var_name: str):
+        self.index_var_name: str = index_var_name
+        self.container_accesses: List[Dict[str, Any]] = []  # 存储 container[index] 的访问
+
+    @classmethod
+    def analyze_loop(cls, loop_node: ast.AST, index_var_name: str) -> List[Dict]:
+        """分析循环体，结果按索引变量缓存在循环节点上（调用方不应修改返回的列表）"""
+        cache = loop_node.__dict__.setdefault('_index_accesses', {})
+        accesses = cache.get(index_var_name)
+        if accesses is None:
+            analyzer = cls(index_var_name)
+            for stmt in loop_node.body:
+                analyzer.visit(stmt)
+            accesses = cache[index_var_name] = analyzer.container_accesses
+        return accesses
+
+    def visit(self, tree: ast.AST) -> None:
+        """显式栈遍历，只处理下标节点，不进入叶子节点"""
+        leaf_types = self._LEAF_TYPES
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, ast.Subscript):
+                self.visit_Subscript(node)
+            # 子节点逆序入栈，保持源代码顺序
+            stack.extend(reversed([child for child in ast.iter_child_nodes(node)
+                                   if not isinstance(child, leaf_types)]))
+
+    def visit_Subscript(self, node: ast.Subscript) -> None:
         """检测 container[index] 和 container[start:end] 访问模式"""
-        container_name = None
-        if isinstance(node.value, ast.Name):
-            container_name = node.value.id
+        if not isinstance(node.value, ast.Name):
+            return
+        container_name = node.value.id
 
         # 1. 检查单个索引访问：container[index]
         if (isinstance(node.slice, ast.Name) and
-            node.slice.id == self.index_var_name and
-            container_name):
+            node.slice.id == self.index_var_name):
 
             self.container_accesses.append({
                 'container': container_name,
                 'line': node.lineno,
                 'access_type': 'single_index'
             })
-            print(f"🔍 [IndexAccess] Found {container_name}[{self.index_var_name}] at line {node.lineno}")
+            logger.debug("🔍 [IndexAccess] Found %s[%s] at line %d", container_name, self.index_var_name, node.lineno)
 
         # 2. 检查切片访问：container[start:end]
-        elif (isinstance(node.slice, ast.Slice) and container_name):
-            slice_vars = []
+        elif isinstance(node.slice, ast.Slice):
+            slice_vars: List[str] = []
 
             # 检查切片的起始位置
             if isinstance(node.slice.lower, ast.Name):
@@ -260,29 +577,58 @@ class IndexAccessAnalyzer(ast.NodeVisitor):
                     'access_type': 'slice',
                     'slice_vars': slice_vars
                 })
-                print(f"🔍 [SliceAccess] Found {container_name}[{':'.join(slice_vars)}] at line {node.lineno}")
-
-        self.generic_visit(node)
+                logger.debug("🔍 [SliceAccess] Found %s[%s] at line %d", container_name, ':'.join(slice_vars), node.lineno)
 
-class CodeAnalyzer(ast.NodeVisitor):
+class CodeAnalyzer:
     """代码分析器 - 分析AST结构并提取信息"""
 
-    def __init__(self):
+    def __init__(self, source_lines: List[str] = None):
+        self.source_lines = source_lines or []
         self.functions = {}
         self.classes = {}
         self.variables = set()
         self.line_map = {}  # 行号到节点的映射
         self.control_flow = []  # 控制流信息
 
+    def visit(self, tree: ast.AST):
+        """遍历AST：显式栈先序遍历，按节点类型查表分派，避免NodeVisitor的反射和递归开销"""
+        dispatch = self._DISPATCH
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            handler = dispatch.get(type(node))
+            if handler is not None:
+                handler(self, node)
+            # 子节点逆序入栈，保证与递归遍历相同的访问顺序
+            stack.extend(reversed(list(ast.iter_child_nodes(node))))
+
+    def _source_of(self, node: ast.AST) -> str:
+        """按节点位置直接截取源代码（列偏移是UTF-8字节偏移）"""
+        lines = self.source_lines
+        first, last = node.lineno - 1, node.end_lineno - 1
+        if last >= len(lines):
+            return ast.unparse(node)
+
+        def cut(line, start=0, end=None):
+            if line.isascii():
+                return line[start:end]
+            return line.encode()[start:end].decode()
+
+        if first == last:
+            return cut(lines[first], node.col_offset, node.end_col_offset)
+        parts = [cut(lines[first], node.col_offset)]
+        parts.extend(lines[first + 1:last])
+        parts.append(cut(lines[last], 0, node.end_col_offset))
+        return '\n'.join(parts)
+
     def visit_FunctionDef(self, node):
         """访问函数定义"""
         self.functions[node.name] = {
             'name': node.name,
             'args': [arg.arg for arg in node.args.args],
             'line': node.lineno,
-            'docstring': ast.get_docstring(node)
+            'docstring': _fast_docstring(node)
         }
-        self.generic_visit(node)
 
     def visit_ClassDef(self, node):
         """访问类定义"""
@@ -290,37 +636,39 @@ class CodeAnalyzer(ast.NodeVisitor):
             'name': node.name,
             'line': node.lineno,
             'methods': [],
-            'docstring': ast.get_docstring(node)
+            'docstring': _fast_docstring(node)
         }
-        self.generic_visit(node)
 
     def visit_Assign(self, node):
-        """访问赋值语句"""
-        for target in node.targets:
-            if isinstance(target, ast.Name):
-                self.variables.add(target.id)
+        """访问赋值语句（包括 a = b = 1 和 a, b = ... 解包赋值），同时预先构建赋值动画模板"""
+        self.variables.update(
+            name.id for target in node.targets for name in ast.walk(target)
+            if isinstance(name, ast.Name) and isinstance(name.ctx, ast.Store)
+        )
         self.line_map[node.lineno] = node
-        self.generic_visit(node)
+        node._anim_template = assignment_animation_template(node)
+
+    def visit_Call(self, node):
+        """访问函数调用：预先构建方法调用的动画模板，执行时直接读取"""
+        node._anim_template = call_animation_template(node)
 
     def visit_If(self, node):
         """访问if语句"""
         self.control_flow.append({
             'type': 'if',
             'line': node.lineno,
-            'condition': ast.unparse(node.test) if hasattr(ast, 'unparse') else 'condition'
+            'condition': self._source_of(node.test)
         })
         self.line_map[node.lineno] = node
-        self.generic_visit(node)
 
     def visit_While(self, node):
         """访问while循环"""
         self.control_flow.append({
             'type': 'while',
             'line': node.lineno,
-            'condition': ast.unparse(node.test) if hasattr(ast, 'unparse') else 'condition'
+            'condition': self._source_of(node.test)
         })
         self.line_map[node.lineno] = node
-        self.generic_visit(node)
 
     def visit_For(self, node):
         """访问for循环"""
@@ -328,10 +676,20 @@ class CodeAnalyzer(ast.NodeVisitor):
             'type': 'for',
             'line': node.lineno,
             'target': node.target.id if isinstance(node.target, ast.Name) else 'target',
-            'iter': ast.unparse(node.iter) if hasattr(ast, 'unparse') else 'iterable'
+            'iter': self._source_of(node.iter)
         })
         self.line_map[node.lineno] = node
-        self.generic_visit(node)
+
+    # 节点类型 -> 处理方法
+    _DISPATCH = {
+        ast.FunctionDef: visit_FunctionDef,
+        ast.ClassDef: visit_ClassDef,
+        ast.Assign: visit_Assign,
+        ast.Call: visit_Call,
+        ast.If: visit_If,
+        ast.While: visit_While,
+        ast.For: visit_For,
+    }
 
 class ASTParser:
     """主要的AST解析器类"""
@@ -339,31 +697,24 @@ class ASTParser:
     def __init__(self):
         self.tree = None
         self.analyzer = None
-        self.source_lines = []
+        self.source_code = ''
+        self.line_count = 0
 
     def parse(self, source_code: str) -> Dict[str, Any]:
         """解析Python源代码"""
         try:
-            # 解析为AST
-            self.tree = ast.parse(source_code)
+            self.tree, self.analyzer, self.line_count = self._parse_cached(source_code)
+            self.source_code = source_code
 
-            # 保存源代码行
-            self.source_lines = source_code.splitlines()
-
-            # 分析AST结构
-            self.analyzer = CodeAnalyzer()
-            self.analyzer.visit(self.tree)
-
-            # 返回分析结果
+            # 返回分析结果（可变部分浅拷贝，避免调用方修改缓存内容）
             return {
                 'success': True,
                 'ast': self.tree,
-                'functions': self.analyzer.functions,
-                'classes': self.analyzer.classes,
+                'functions': dict(self.analyzer.functions),
+                'classes': dict(self.analyzer.classes),
                 'variables': list(self.analyzer.variables),
-                'control_flow': self.analyzer.control_flow,
-                'line_count': len(self.source_lines),
-                'source_lines': self.source_lines
+                'control_flow': list(self.analyzer.control_flow),
+                'line_count': self.line_count
             }
 
         except SyntaxError as e:
@@ -381,6 +732,50 @@ class ASTParser:
                 'message': str(e)
             }
 
+    @staticmethod
+    def _parse_cached(source_code: str) -> Tuple[ast.Module, 'CodeAnalyzer', int]:
+        """解析并分析源代码，结果按源代码哈希缓存（LRU）"""
+        cacheable = len(source_code) < PARSE_CACHE_MAX_SOURCE
+        if cacheable:
+            key = source_digest(source_code)
+            entry = _pinned_parses.get(key)
+            if entry is not None:
+                return entry
+            with _parse_cache_lock:
+                entry = _parse_cache.get(key)
+                if entry is not None:
+                    _parse_cache.move_to_end(key)
+                    return entry
+
+        entry = ASTParser._analyze(source_code)
+        if cacheable:
+            with _parse_cache_lock:
+                _parse_cache[key] = entry
+                if len(_parse_cache) > PARSE_CACHE_SIZE:
+                    _parse_cache.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _analyze(source_code: str) -> Tuple[ast.Module, 'CodeAnalyzer', int]:
+        """解析源代码并分析AST结构"""
+        # 解析为AST
+        tree = ast.parse(source_code)
+
+        # 分析AST结构（按ast的换行规则切分源代码行，保证行号对应）
+        analyzer = CodeAnalyzer(_LINE_BREAK.split(source_code))
+        analyzer.visit(tree)
+        analyzer.source_lines = None  # 分析完成后不再持有源代码行
+
+        return tree, analyzer, len(source_code.splitlines())
+
+    @staticmethod
+    def preload(sources) -> None:
+        """预先解析固定的源代码（如内置示例），结果常驻缓存"""
+        for source_code in sources:
+            key = source_digest(source_code)
+            if key not in _pinned_parses:
+                _pinned_parses[key] = ASTParser._analyze(source_code)
+
     def get_line_info(self, line_number: int) -> Optional[Dict]:
         """获取指定行的信息"""
         if not self.analyzer or line_number not in self.analyzer.line_map:
@@ -390,9 +785,16 @@ class ASTParser:
         return {
             'line': line_number,
             'node_type': type(node).__name__,
-            'content': self.source_lines[line_number - 1] if line_number <= len(self.source_lines) else ''
+            'content': self._source_line(line_number)
         }
 
+    def _source_line(self, line_number: int) -> str:
+        """按需截取源代码中的一行（换行规则与ast的行号一致）"""
+        if not 1 <= line_number <= self.line_count:
+            return ''
+        lines = _LINE_BREAK.split(self.source_code, line_number)
+        return lines[line_number - 1] if line_number <= len(lines) else ''
+
     def get_ast_dump(self) -> str:
         """获取AST的文本表示"""
         if not self.tree:
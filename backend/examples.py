@@ -1,6 +1,8 @@
 """
 Python代码示例 - 用于测试变量可视化效果
 """
+from functools import lru_cache
+from types import MappingProxyType
 
 examples = [
     {
@@ -215,10 +217,14 @@ print("字典内容:", my_dict)
     }
 ]
 
+# 示例在导入后冻结为只读映射的元组，进程内不可修改（预先序列化的响应依赖这一点）
+examples = tuple(MappingProxyType(example) for example in examples)
+
 def get_examples():
-    """获取所有示例"""
+    """获取所有示例（只读）"""
     return examples
 
+@lru_cache(maxsize=32)
 def get_example_by_index(index):
     """根据索引获取示例"""
     if 0 <= index < len(examples):
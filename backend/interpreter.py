@@ -2,16 +2,208 @@
 自定义Python解释器 - 执行AST并生成可视化数据
 """
 import ast
-import copy
+import builtins
+import logging
+import operator
+import sys
 import time
-from typing import Dict, List, Any, Optional, Union
-from ast_parser import ExecutionHook, IndexAccessAnalyzer
+import types
+from itertools import islice
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from ast_parser import (ExecutionHook, IndexAccessAnalyzer, USER_CODE_FILENAME, VIS_HOOK_NAME,
+                        assignment_animation_template, call_animation_template, variable_name)
+import jit_compile
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()  # 变量不存在的标记
+_CO_OPTIMIZED = 0x0001  # 函数的代码对象带有该标志（模块和类体没有）
+
+# 不可变标量类型，序列化结果可以在值不变时复用
+_SCALAR_TYPES = frozenset({int, float, str, bool, type(None)})
+
+# (对象类型, 方法名) -> 未绑定的方法，execute_Call 对这些常见调用跳过属性查找
+_FAST_METHODS = {
+    (list, 'append'): list.append,
+    (list, 'insert'): list.insert,
+    (set, 'add'): set.add,
+    (dict, 'update'): dict.update,
+}
+_FAST_METHOD_NAMES = frozenset(name for _, name in _FAST_METHODS)
+
+# 运算符节点类型 -> 运算函数
+_BINOPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.MatMult: operator.matmul,
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_,
+    ast.BitXor: operator.xor,
+    ast.LShift: operator.lshift,
+    ast.RShift: operator.rshift,
+}
+
+# 增量赋值使用就地运算（如列表的 += 原地扩展）
+_AUGOPS = {
+    ast.Add: operator.iadd,
+    ast.Sub: operator.isub,
+    ast.Mult: operator.imul,
+    ast.Div: operator.itruediv,
+    ast.FloorDiv: operator.ifloordiv,
+    ast.Mod: operator.imod,
+    ast.Pow: operator.ipow,
+    ast.MatMult: operator.imatmul,
+    ast.BitAnd: operator.iand,
+    ast.BitOr: operator.ior,
+    ast.BitXor: operator.ixor,
+    ast.LShift: operator.ilshift,
+    ast.RShift: operator.irshift,
+}
+
+_UNOPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+    ast.Not: operator.not_,
+    ast.Invert: operator.invert,
+}
+
+_CMPOPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda x, y: x in y,
+    ast.NotIn: lambda x, y: x not in y,
+}
+
+def _compile_expr(node: ast.AST) -> Optional[Callable[['PythonInterpreter'], Any]]:
+    """把纯表达式子树编译为闭包 thunk(interpreter)，结果缓存在节点上；
+    含调用、下标等需要记录步骤或动画的节点时返回None，仍由execute逐节点执行"""
+    try:
+        return node._thunk
+    except AttributeError:
+        pass
+    thunk = _build_thunk(node)
+    node._thunk = thunk  # 闭包不持有解释器，缓存的AST可以在多个解释器间共享
+    return thunk
+
+def _build_thunk(node: ast.AST) -> Optional[Callable[['PythonInterpreter'], Any]]:
+    """按节点类型构建闭包"""
+    node_type = type(node)
+
+    if node_type is ast.Constant:
+        value = node.value
+        return lambda interp: value
+
+    if node_type is ast.Name:
+        name = node.id
+        return lambda interp: interp.get_variable(name)
+
+    if node_type is ast.BinOp:
+        op = _BINOPS.get(type(node.op))
+        left = _compile_expr(node.left)
+        right = _compile_expr(node.right)
+        if op is None or left is None or right is None:
+            return None
+        return lambda interp: op(left(interp), right(interp))
+
+    if node_type is ast.UnaryOp:
+        op = _UNOPS.get(type(node.op))
+        operand = _compile_expr(node.operand)
+        if op is None or operand is None:
+            return None
+        return lambda interp: op(operand(interp))
+
+    if node_type is ast.Compare:
+        left = _compile_expr(node.left)
+        pairs = [(_CMPOPS.get(type(op)), _compile_expr(right))
+                 for op, right in zip(node.ops, node.comparators)]
+        if left is None or any(op is None or right is None for op, right in pairs):
+            return None
+
+        if len(pairs) == 1:
+            # 最常见的单个比较：展开循环
+            (op, right), = pairs
+            return lambda interp: True if op(left(interp), right(interp)) else False
+
+        def compare(interp):
+            current = left(interp)
+            for op, right in pairs:
+                value = right(interp)
+                if not op(current, value):
+                    return False
+                current = value  # Chain comparisons
+            return True
+        return compare
+
+    if node_type is ast.BoolOp:
+        values = [_compile_expr(value) for value in node.values]
+        if any(value is None for value in values):
+            return None
+        # 与Python一致：返回决定结果的那个操作数，而不是转换后的布尔值
+        if isinstance(node.op, ast.And):
+            def conjunction(interp):
+                for value in values:
+                    result = value(interp)
+                    if not result:
+                        return result
+                return result
+            return conjunction
+
+        def disjunction(interp):
+            for value in values:
+                result = value(interp)
+                if result:
+                    return result
+            return result
+        return disjunction
+
+    return None
+
+def _slot(node: ast.AST) -> tuple:
+    """预处理容器字面量中的一个元素：常量返回 (值, None, None)，否则返回 (None, 表达式, 闭包或None)"""
+    if isinstance(node, ast.Constant):
+        return node.value, None, None
+    return None, node, _compile_expr(node)
+
+def _same_entries(current: Dict[str, Any], previous: Dict[str, Any]) -> bool:
+    """两个序列化后的作用域是否逐项相同（序列化结果在未变化时复用，按身份比较即可）"""
+    if len(current) != len(previous):
+        return False
+    get = previous.get
+    for name, entry in current.items():
+        if get(name) is not entry:
+            return False
+    return True
 
 class PythonObject:
     """自定义对象类，用于表示Python对象"""
-    def __init__(self, class_name: str, attributes: Dict = None):
+    __slots__ = ('class_name', 'attributes', 'class_dict')
+
+    def __init__(self, class_name: str, attributes: Dict = None, class_dict: Dict = None):
         self.class_name = class_name
         self.attributes = attributes or {}
+        self.class_dict = class_dict if class_dict is not None else {}  # 类体中定义的属性和方法
+
+    def get_attribute(self, name: str) -> Any:
+        """查找实例属性，再查找类属性；类中定义的函数绑定为方法"""
+        if name in self.attributes:
+            return self.attributes[name]
+        if name in self.class_dict:
+            value = self.class_dict[name]
+            if isinstance(value, types.FunctionType):
+                return types.MethodType(value, self)
+            return value
+        raise AttributeError(f"'{self.class_name}' object has no attribute '{name}'")
 
 class ExecutionError(Exception):
     """执行时错误"""
@@ -20,9 +212,26 @@ class ExecutionError(Exception):
 class PythonInterpreter:
     """自定义Python解释器"""
 
+    __slots__ = (
+        'hook', 'execution_delay', 'execution_manager', 'global_scope', 'local_scopes',
+        '_lookup_chain', '_closure_chain', 'return_value', 'break_flag', 'continue_flag',
+        'output_buffer', 'step_mode', 'should_stop', '_step_anim_keys',
+        'current_tracking_line', '_tick', '_global_serialized', '_local_serialized', '_last_variables',
+        '_serialized_containers', 'native_loops', '_pace_deadline',
+    )
+
+    TICK_MASK = 63  # 非记录节点每64个检查一次停止/暂停状态
+
+    # 需要记录执行步骤的节点类型
+    _TRACKED_TYPES = frozenset({
+        ast.Assign, ast.AugAssign, ast.AnnAssign, ast.If, ast.For, ast.While, ast.FunctionDef, ast.ClassDef,
+        ast.Return, ast.Expr, ast.Call
+    })
+
     def __init__(self, execution_hook: ExecutionHook, execution_delay: float = 0.3):
         self.hook = execution_hook
         self.execution_delay = execution_delay  # 执行延迟（秒）
+        self._pace_deadline = 0.0  # 上一步延迟的截止时间（time.monotonic）
         self.execution_manager = None  # 将被设置为ExecutionManager的引用
         self.global_scope = {
             # 内置函数
@@ -40,13 +249,23 @@ class PythonInterpreter:
             'min': min,
         }
         self.local_scopes = []  # 函数调用栈的局部作用域
+        self._lookup_chain = ()  # 当前代码按词法作用域查找名称时依次检查的作用域（不含全局）
+        self._closure_chain = ()  # 在当前位置定义的函数捕获的外层作用域（类体不算外层作用域）
         self.return_value = None
         self.break_flag = False
         self.continue_flag = False
         self.output_buffer = []
         self.step_mode = False  # 单步模式标志
         self.should_stop = False  # 停止执行标志
-        self.recorded_animations_this_step = set()  # 防止同一步骤录制重复动画
+        self._step_anim_keys = set()  # 防止同一步骤录制重复动画
+        self.current_tracking_line = -1  # 最近一次记录步骤的行号
+        self._tick = 0  # 已执行的节点数，用于采样停止/暂停检查
+        self._global_serialized = {}  # 变量名 -> (标量值, 序列化结果)，用于复用未变化的标量
+        self._local_serialized = {}
+        self._last_variables = None  # 上一次的变量快照（只读），未变化的作用域在快照之间共享
+        # id(容器) -> (容器, 序列化结果)，跨步骤复用；任何可能原地修改容器的操作（下标/属性赋值、增量赋值、调用）都会清空
+        self._serialized_containers = {}
+        self.native_loops = False  # 开启后纯数值循环和函数以原生字节码执行（仅在无延迟连续执行时生效）
 
     def _builtin_print(self, *args, **kwargs):
         """自定义print函数"""
@@ -67,98 +286,237 @@ class PythonInterpreter:
 
     def get_variable(self, name: str) -> Any:
         """获取变量"""
-        # 首先检查局部作用域
-        for scope in reversed(self.local_scopes):
+        # 首先按词法作用域检查局部和外层函数作用域（与调用深度无关）
+        for scope in self._lookup_chain:
             if name in scope:
                 return scope[name]
 
-        # 然后检查全局作用域
-        if name in self.global_scope:
+        # 然后检查全局作用域：命中是常态，只探测一次字典
+        try:
             return self.global_scope[name]
+        except KeyError:
+            raise NameError(f"name '{name}' is not defined") from None
+
+    def _lookup_variable(self, name: str) -> Any:
+        """与 get_variable 相同的查找顺序，找不到时返回 _MISSING 而不抛出异常（用于动画检测）"""
+        for scope in self._lookup_chain:
+            if name in scope:
+                return scope[name]
+        return self.global_scope.get(name, _MISSING)
 
-        raise NameError(f"name '{name}' is not defined")
+    def _lookup_in(self, chain: Tuple[Dict, ...], name: str) -> Any:
+        """在给定的外层作用域链和全局作用域中查找名称"""
+        for scope in chain:
+            if name in scope:
+                return scope[name]
+        try:
+            return self.global_scope[name]
+        except KeyError:
+            raise NameError(f"name '{name}' is not defined") from None
 
     def execute(self, node: ast.AST) -> Any:
         """执行AST节点"""
-        # 检查是否应该停止执行
-        if self.should_stop:
-            print("Execution stopped by flag")
-            raise ExecutionError("Execution stopped")
-
-        # 对所有节点都检查暂停状态，确保暂停功能及时响应
-        self._check_pause_state()
+        node_type = type(node)
+        method, tracked = self._DISPATCH.get(node_type, self._GENERIC_ENTRY)
+
+        # 停止/暂停检查按计数采样：每 TICK_MASK+1 个节点以及每个需要记录的节点检查一次
+        tick = self._tick + 1
+        self._tick = tick
+        if tracked or not tick & self.TICK_MASK:
+            # 检查是否应该停止执行
+            if self.should_stop:
+                logger.debug("Execution stopped by flag")
+                raise ExecutionError("Execution stopped")
 
-        method_name = f'execute_{type(node).__name__}'
-        method = getattr(self, method_name, self.execute_generic)
+            # 检查暂停状态，确保暂停功能及时响应
+            self._check_pause_state()
 
         # 只在重要的节点记录执行步骤和添加延迟
-        should_track = hasattr(node, 'lineno') and type(node).__name__ in [
-            'Assign', 'AnnAssign', 'If', 'For', 'While', 'FunctionDef', 'ClassDef',
-            'Return', 'Expr', 'Call'
-        ]
-
-        if should_track:
-            # 再次检查停止标志（在延迟前）
-            if self.should_stop:
-                raise ExecutionError("Execution stopped")
+        if tracked:
 
-            # 如果切换到新行，清空本步骤的动画记录
-            if hasattr(self, 'current_tracking_line') and self.current_tracking_line != node.lineno:
-                self.recorded_animations_this_step.clear()
-            self.current_tracking_line = node.lineno
+            # 如果切换到新行，清空本步骤的动画记录（多数步骤没有动画，集合为空时不必清空）
+            line = node.lineno
+            if self.current_tracking_line != line:
+                self.current_tracking_line = line
+                if self._step_anim_keys:
+                    self._step_anim_keys.clear()
 
-            self.hook.current_line = node.lineno
+            self.hook.current_line = line
             self.hook.record_step(
-                type(node).__name__,
-                node.lineno,
-                f"Executing line {node.lineno}: {type(node).__name__}",
+                node_type.__name__,
+                line,
+                f"Executing line {line}: {node_type.__name__}",
                 self.get_all_variables(),
                 self.hook.call_stack
             )
 
             # 添加延迟以便用户看到可视化效果（分成小段，便于中断和暂停）
             if self.execution_delay > 0:
-                print(f"Applying execution delay: {self.execution_delay:.2f}s at line {node.lineno}")
-                self._sleep_with_pause_check(self.execution_delay)
-
-        return method(node)
-
-    def _check_pause_state(self):
-        """检查暂停状态，如果暂停则等待恢复"""
-        if self.execution_manager and self.execution_manager.is_paused:
-            print("Execution paused - waiting for resume...")
-            print(f"Manager state: is_paused={self.execution_manager.is_paused}, is_running={self.execution_manager.is_running}")
+                self._pace()
+
+        return method(self, node)
+
+    def execute_compiled(self, code, last_line: int = 0) -> Any:
+        """快速模式：在CPython虚拟机上直接运行编译后的字节码，只记录最终状态"""
+        # 只暴露与解释器相同的内置函数（print 已在全局作用域中重定向到输出缓冲区）
+        self.global_scope.setdefault('__builtins__', {'__build_class__': builtins.__build_class__})
+        self.global_scope.setdefault('__name__', '__main__')
+
+        self._run_with_stop_tracer(exec, code, self.global_scope, exact_lines=True)
+        self._serialized_containers.clear()
+
+        self.hook.current_line = last_line
+        self.hook.record_step(
+            'Module',
+            last_line,
+            "Executed in fast mode",
+            self.get_all_variables(),
+            self.hook.call_stack
+        )
+        return None
 
-            while self.execution_manager.is_paused:
-                # 在等待时检查是否被停止
-                if self.should_stop:
-                    print("Execution stopped while paused")
-                    raise ExecutionError("Execution stopped while paused")
-                time.sleep(0.1)  # 短暂等待，避免忙等待
+    def execute_instrumented(self, code) -> Any:
+        """插桩模式：在CPython虚拟机上运行插桩后的字节码，每条语句前通过 __vis_hook__ 记录步骤"""
+        self.global_scope.setdefault('__builtins__', {'__build_class__': builtins.__build_class__})
+        self.global_scope.setdefault('__name__', '__main__')
+        self.global_scope[VIS_HOOK_NAME] = self._instrumented_step
+        try:
+            exec(code, self.global_scope)
+        finally:
+            del self.global_scope[VIS_HOOK_NAME]
+            self._serialized_containers.clear()
+            self.hook.call_stack = ()
+        return None
 
-            print("Execution resumed from pause")
-            print(f"Manager state after resume: is_paused={self.execution_manager.is_paused}, is_running={self.execution_manager.is_running}")
+    def _instrumented_step(self, line: int, node_type: Optional[str]):
+        """插桩代码的步骤回调：从调用者的帧读取变量和调用栈，记录步骤并处理停止、暂停和延迟；
+        node_type 为None时（循环体开头）只检查停止和暂停"""
+        if self.should_stop:
+            raise ExecutionError("Execution stopped")
+        self._check_pause_state()
+        if node_type is None:
+            return
 
-    def _sleep_with_pause_check(self, delay_seconds):
-        """带暂停检查的延迟函数"""
-        # 将延迟分解为小段，每段检查暂停和停止状态
-        delay_segments = int(delay_seconds * 10)  # 100ms 段
-        for i in range(delay_segments):
+        if self.current_tracking_line != line:
+            self.current_tracking_line = line
+            if self._step_anim_keys:
+                self._step_anim_keys.clear()
+
+        # 字节码执行时可能原地修改了容器
+        memo = self._serialized_containers
+        memo.clear()
+        frame = sys._getframe(1)
+        global_vars = self._serialize_scope(self.global_scope, self._global_serialized, memo)
+        local_vars = (self._serialize_scope(frame.f_locals, self._local_serialized, memo)
+                      if frame.f_code.co_name != '<module>' else {})
+        variables = self._shared_snapshot(global_vars, local_vars)
+
+        # 调用栈由用户代码的函数帧得到，与解释执行时的 "函数名()" 一致；没有变化时沿用原元组
+        call_stack = []
+        caller = frame
+        while caller is not None and caller.f_code.co_filename == USER_CODE_FILENAME:
+            code = caller.f_code
+            if code.co_flags & _CO_OPTIMIZED and not code.co_name.startswith('<'):
+                call_stack.append(f"{code.co_name}()")
+            caller = caller.f_back
+        call_stack = tuple(reversed(call_stack))
+        if call_stack != self.hook.call_stack:
+            self.hook.call_stack = call_stack
+
+        self.hook.current_line = line
+        self.hook.record_step(node_type, line, f"Executing line {line}: {node_type}", variables, self.hook.call_stack)
+
+        if self.execution_delay > 0:
+            self._pace()
+
+    def _run_with_stop_tracer(self, func: Callable, *args, exact_lines: bool = False) -> Any:
+        """运行编译后的用户代码，通过跟踪函数响应停止和暂停请求；
+        exact_lines 表示字节码的行号与用户源代码一致（快速模式），否则暂停时沿用当前记录的行号"""
+        manager = self.execution_manager
+
+        def stop_tracer(frame, event, arg):
+            # 只跟踪用户代码的帧
+            if frame.f_code.co_filename != USER_CODE_FILENAME:
+                return None
             if self.should_stop:
-                raise ExecutionError("Execution stopped during delay")
+                raise ExecutionError("Execution stopped")
+            if manager and not manager.pause_event.is_set():
+                self._pause_compiled(frame.f_lineno if exact_lines else self.hook.current_line)
+            return stop_tracer
 
-            # 检查暂停状态
-            self._check_pause_state()
+        previous_tracer = sys.gettrace()
+        sys.settrace(stop_tracer)
+        try:
+            return func(*args)
+        finally:
+            sys.settrace(previous_tracer)
+
+    def _pause_compiled(self, line: int):
+        """字节码执行中被暂停：记录暂停位置的状态，然后等待恢复"""
+        self._serialized_containers.clear()  # 字节码执行时可能原地修改了容器
+        self.hook.current_line = line
+        self.hook.record_step(
+            'Pause',
+            line,
+            f"Paused at line {line}",
+            self.get_all_variables(),
+            self.hook.call_stack
+        )
+        self._check_pause_state()
+
+    def _native_loops_enabled(self) -> bool:
+        """无延迟的连续执行时，纯数值循环和函数可以直接以字节码运行"""
+        if not self.native_loops or self.execution_delay > 0 or self.step_mode:
+            return False
+        return not (self.execution_manager and self.execution_manager.step_mode)
 
-            time.sleep(0.1)
+    def _check_pause_state(self):
+        """检查暂停状态，如果暂停则阻塞等待恢复（停止时也会被唤醒）"""
+        manager = self.execution_manager
+        if manager and not manager.pause_event.is_set():
+            logger.debug("Execution paused - waiting for resume...")
+            manager.pause_event.wait()
 
-        # 处理剩余的小数部分
-        remaining = delay_seconds - (delay_segments * 0.1)
-        if remaining > 0:
+            # 停止执行时会同时解除暂停
             if self.should_stop:
-                raise ExecutionError("Execution stopped")
-            self._check_pause_state()
-            time.sleep(remaining)
+                logger.debug("Execution stopped while paused")
+                raise ExecutionError("Execution stopped while paused")
+            logger.debug("Execution resumed from pause")
+
+    def _pace(self):
+        """按固定节拍等待：每一步的截止时间由上一步的截止时间累加得到，步骤本身的耗时计入节拍，
+        等待不会累积漂移；已经落后于节拍时（第一步、暂停恢复后或单步耗时超过延迟）从当前时间重新计时"""
+        delay = self.execution_delay
+        now = time.monotonic()
+        deadline = self._pace_deadline + delay
+        if deadline < now:
+            deadline = now + delay
+        self._pace_deadline = deadline
+        self._sleep_with_pause_check(deadline - now)
+
+    def _sleep_with_pause_check(self, delay_seconds):
+        """带暂停检查的延迟函数：延迟中收到暂停或停止请求时立即响应，恢复后继续剩余的延迟"""
+        self._check_pause_state()
+        manager = self.execution_manager
+        if not manager:
+            time.sleep(delay_seconds)
+        else:
+            def interrupted():
+                return manager.stop_event.is_set() or not manager.pause_event.is_set()
+
+            remaining = delay_seconds
+            while remaining > 0:
+                deadline = time.monotonic() + remaining
+                with manager.state_changed:
+                    manager.state_changed.wait_for(interrupted, remaining)
+                remaining = deadline - time.monotonic()
+                if manager.stop_event.is_set():
+                    break
+                # 暂停时阻塞到恢复，暂停的时间不计入延迟
+                self._check_pause_state()
+
+        if (manager and manager.stop_event.is_set()) or self.should_stop:
+            raise ExecutionError("Execution stopped during delay")
 
     def execute_generic(self, node: ast.AST) -> Any:
         """通用执行方法"""
@@ -175,21 +533,31 @@ class PythonInterpreter:
 
     def execute_FunctionDef(self, node: ast.FunctionDef) -> None:
         """执行函数定义"""
-        def user_function(*args, **kwargs):
-            # 创建新的局部作用域
-            local_scope = {}
+        # 定义时捕获外层函数的作用域，调用时按词法作用域查找名称
+        enclosing = self._closure_chain
+        try:
+            arg_names = node._arg_names
+        except AttributeError:
+            arg_names = node._arg_names = tuple(arg.arg for arg in node.args.args)
+        frame_name = f"{node.name}()"
 
-            # 绑定参数
-            for i, arg in enumerate(node.args.args):
-                if i < len(args):
-                    local_scope[arg.arg] = args[i]
+        def user_function(*args, **kwargs):
+            # 纯数值函数在无延迟连续执行时直接以字节码运行
+            if not kwargs and self._native_loops_enabled():
+                run = jit_compile.prepare_function(node, args, lambda name: self._lookup_in(enclosing, name), user_function)
+                if run is not None:
+                    return self._run_with_stop_tracer(run)
 
-            for key, value in kwargs.items():
-                local_scope[key] = value
+            # 创建新的局部作用域并绑定参数
+            local_scope = dict(zip(arg_names, args))
+            if kwargs:
+                local_scope.update(kwargs)
 
             # 进入函数作用域
             self.local_scopes.append(local_scope)
-            self.hook.call_stack.append(f"{node.name}()")
+            saved_chains = self._lookup_chain, self._closure_chain
+            self._lookup_chain = self._closure_chain = (local_scope,) + enclosing
+            self.hook.call_stack += (frame_name,)
 
             try:
                 # 执行函数体
@@ -205,7 +573,8 @@ class PythonInterpreter:
             finally:
                 # 退出函数作用域
                 self.local_scopes.pop()
-                self.hook.call_stack.pop()
+                self._lookup_chain, self._closure_chain = saved_chains
+                self.hook.call_stack = self.hook.call_stack[:-1]
 
         # 将函数添加到当前作用域
         self.set_variable(node.name, user_function)
@@ -215,22 +584,27 @@ class PythonInterpreter:
         class_dict = {}
 
         # 创建类的命名空间
-        old_scopes = self.local_scopes[:]
-        self.local_scopes = [class_dict]
+        saved_depth = len(self.local_scopes)
+        self.local_scopes.append(class_dict)
+        old_lookup_chain = self._lookup_chain
+        self._lookup_chain = (class_dict,) + old_lookup_chain
 
         try:
             # 执行类体
             for stmt in node.body:
                 self.execute(stmt)
         finally:
-            self.local_scopes = old_scopes
+            del self.local_scopes[saved_depth:]
+            self._lookup_chain = old_lookup_chain
 
         # 创建类对象
+        init_fn = class_dict.get('__init__')
+
         def class_constructor(*args, **kwargs):
-            obj = PythonObject(node.name)
+            obj = PythonObject(node.name, class_dict=class_dict)
             # 如果有__init__方法，调用它
-            if '__init__' in class_dict:
-                class_dict['__init__'](obj, *args, **kwargs)
+            if init_fn is not None:
+                init_fn(obj, *args, **kwargs)
             return obj
 
         self.set_variable(node.name, class_constructor)
@@ -249,29 +623,43 @@ class PythonInterpreter:
                 obj = self.execute(target.value)
                 key = self.execute(target.slice)
                 obj[key] = value
+                self._serialized_containers.clear()
             elif isinstance(target, ast.Attribute):
                 obj = self.execute(target.value)
-                setattr(obj, target.attr, value)
+                if isinstance(obj, PythonObject):
+                    obj.attributes[target.attr] = value
+                else:
+                    setattr(obj, target.attr, value)
+                self._serialized_containers.clear()
 
-        # 如果检测到动画操作，记录动画信息（仅在真正执行完成后）
+        # 如果检测到动画操作，记录动画信息（仅在真正执行完成后）；赋值动画的标识符是静态的，随模板缓存
         if animation_data:
-            # 创建动画标识符，防止同一行重复录制
-            animation_key = (
-                animation_data.get('line'),
-                animation_data.get('operation'),
-                animation_data.get('source_variable'),
-                animation_data.get('target_variable')
-            )
-
-            if animation_key not in self.recorded_animations_this_step:
-                animation_data['completed'] = True
-                # 添加执行步骤计数来确保唯一性
-                animation_data['step_count'] = self.hook.step_count
-                print(f"🔧 [Debug] Recording Assign animation: {animation_data}")
-                self.hook.record_animation_step(animation_data)
-                self.recorded_animations_this_step.add(animation_key)
+            self._record_animation(animation_data, node._anim_template[1], 'Assign')
+
+    def execute_AugAssign(self, node: ast.AugAssign) -> None:
+        """执行增量赋值语句，如 i += 1"""
+        op_func = _AUGOPS.get(type(node.op))
+        if op_func is None:
+            raise NotImplementedError(f"Augmented operator {type(node.op).__name__} not implemented")
+
+        target = node.target
+        if isinstance(target, ast.Name):
+            current = self.get_variable(target.id)
+            self.set_variable(target.id, op_func(current, self.execute(node.value)))
+        elif isinstance(target, ast.Subscript):
+            obj = self.execute(target.value)
+            key = self.execute(target.slice)
+            obj[key] = op_func(obj[key], self.execute(node.value))
+        elif isinstance(target, ast.Attribute):
+            obj = self.execute(target.value)
+            value = op_func(self._get_attribute(obj, target.attr), self.execute(node.value))
+            if isinstance(obj, PythonObject):
+                obj.attributes[target.attr] = value
             else:
-                print(f"🔧 [Debug] Skipping duplicate Assign animation in same step: {animation_key}")
+                setattr(obj, target.attr, value)
+
+        # 列表等可变对象的增量赋值是原地修改
+        self._serialized_containers.clear()
 
     def execute_AnnAssign(self, node: ast.AnnAssign) -> None:
         """执行带注解的赋值"""
@@ -299,42 +687,49 @@ class PythonInterpreter:
                 self.execute(stmt)
 
     def execute_While(self, node: ast.While) -> Any:
-        """执行while循环"""
-        while True:
-            condition = self.execute(node.test)
-            if not condition:
-                break
-
-            for stmt in node.body:
-                self.execute(stmt)
-                if self.break_flag:
-                    self.break_flag = False
-                    return
-                if self.continue_flag:
-                    self.continue_flag = False
+        """执行while循环：语句循环内只做一次合并的控制流检查"""
+        execute = self.execute
+        test = node.test
+        body = node.body
+        while execute(test):
+            for stmt in body:
+                execute(stmt)
+                if self.break_flag or self.continue_flag or self.return_value is not None:
                     break
-                if self.return_value is not None:
-                    return
+            else:
+                continue
+
+            if self.break_flag:
+                self.break_flag = False
+                return
+            if self.return_value is not None:
+                return
+            self.continue_flag = False
 
     def execute_For(self, node: ast.For) -> Any:
         """执行for循环"""
-        iterable = self.execute(node.iter)
+        if self._native_loops_enabled():
+            run = jit_compile.prepare(node, self.get_variable)
+            if run is not None:
+                for name, value in self._run_with_stop_tracer(run).items():
+                    self.set_variable(name, value)
+                return None
 
-        # 检测是否为直接遍历容器（for item in container）
-        container_name = None
-        if isinstance(node.iter, ast.Name):
-            container_name = node.iter.id
-
-        iterator_var_name = None
-        if isinstance(node.target, ast.Name):
-            iterator_var_name = node.target.id
+        iterable = self.execute(node.iter)
 
-        # 检测是否为索引循环模式（for i in range(len(container))）
-        index_loop_info = self._detect_index_loop_pattern(node, iterator_var_name)
+        # 循环的遍历模式只取决于AST，缓存在节点上（外层循环每次进入时不再重新分析）
+        try:
+            container_name, iterator_var_name, index_loop_info = node._loop_info
+        except AttributeError:
+            container_name, iterator_var_name, index_loop_info = node._loop_info = self._loop_info(node)
 
-        print(f"🔄 [For Loop] Starting loop: {iterator_var_name} in {container_name}")
+        logger.debug("🔄 [For Loop] Starting loop: %s in %s", iterator_var_name, container_name)
         if index_loop_info:
-            print(f"🔍 [Index Loop] Detected index loop: {iterator_var_name} -> {index_loop_info['container']}")
+            logger.debug("🔍 [Index Loop] Detected index loop: %s -> %s", iterator_var_name, index_loop_info['container'])
+
+        # 与容器无关的 for 变量 in range(...)：走不需要遍历上下文的整数计数循环
+        if type(iterable) is range and iterator_var_name and not container_name and not index_loop_info:
+            return self._execute_range_loop(node, iterable, iterator_var_name)
 
         # 开始循环上下文（直接遍历或索引遍历）
         if container_name and iterator_var_name:
@@ -345,10 +740,16 @@ class PythonInterpreter:
             pattern = index_loop_info.get('pattern', 'simple')
             self.hook.push_iteration_context(index_loop_info['container'], iterator_var_name, node.lineno, pattern)
 
+        execute = self.execute
+        set_variable = self.set_variable
+        body = node.body
+        # 遍历容器在整个循环期间不变
+        active_container = container_name or (index_loop_info['container'] if index_loop_info else None)
+
         try:
             for index, item in enumerate(iterable):
-                if isinstance(node.target, ast.Name):
-                    self.set_variable(node.target.id, item)
+                if iterator_var_name is not None:
+                    set_variable(iterator_var_name, item)
 
                 # 更新当前遍历索引（直接遍历或索引遍历）
                 if container_name and iterator_var_name:
@@ -365,7 +766,6 @@ class PythonInterpreter:
                         self.hook.update_iteration_index(iterator_var_name, index)
 
                 # 检测并记录多索引访问（双指针模式）
-                active_container = container_name or (index_loop_info['container'] if index_loop_info else None)
                 if active_container:
                     self._detect_and_record_multi_index_access(active_container)
 
@@ -378,27 +778,66 @@ class PythonInterpreter:
                             'node_type': 'Iteration',
                             'description': f"Iterating {iterator_var_name} in {active_container}[{index}]",
                             'variables': self.get_all_variables(),
-                            'call_stack': list(self.hook.call_stack),
+                            'call_stack': self.hook.call_stack,
                             'iteration_stack': self.hook.get_iteration_stack(),
                             'timestamp': self.hook.step_count
                         }
                         self.hook.emit_callback(iteration_event)
 
-                for stmt in node.body:
-                    self.execute(stmt)
-                    if self.break_flag:
-                        self.break_flag = False
-                        return
-                    if self.continue_flag:
-                        self.continue_flag = False
+                for stmt in body:
+                    execute(stmt)
+                    if self.break_flag or self.continue_flag or self.return_value is not None:
                         break
-                    if self.return_value is not None:
-                        return
+                else:
+                    continue
+
+                if self.break_flag:
+                    self.break_flag = False
+                    return
+                if self.return_value is not None:
+                    return
+                self.continue_flag = False
         finally:
             # 循环结束后弹出上下文
             if (container_name or index_loop_info) and iterator_var_name:
                 self.hook.pop_iteration_context(iterator_var_name)
 
+    def _loop_info(self, node: ast.For) -> tuple:
+        """分析for循环，返回 (直接遍历的容器名, 循环变量名, 索引循环信息)"""
+        # 检测是否为直接遍历容器（for item in container）
+        container_name = None
+        if isinstance(node.iter, ast.Name):
+            container_name = node.iter.id
+
+        iterator_var_name = None
+        if isinstance(node.target, ast.Name):
+            iterator_var_name = node.target.id
+
+        # 检测是否为索引循环模式（for i in range(len(container))）
+        index_loop_info = self._detect_index_loop_pattern(node, iterator_var_name)
+        return container_name, iterator_var_name, index_loop_info
+
+    def _execute_range_loop(self, node: ast.For, iterable: range, name: str) -> Any:
+        """执行遍历range的for循环：直接写入当前作用域，省去每次迭代的set_variable和遍历状态维护"""
+        execute = self.execute
+        body = node.body
+        scope = self.get_current_scope()
+        for value in iterable:
+            scope[name] = value
+            for stmt in body:
+                execute(stmt)
+                if self.break_flag or self.continue_flag or self.return_value is not None:
+                    break
+            else:
+                continue
+
+            if self.break_flag:
+                self.break_flag = False
+                return
+            if self.return_value is not None:
+                return
+            self.continue_flag = False
+
     def _detect_index_loop_pattern(self, for_node: ast.For, iterator_var_name: str) -> Optional[Dict]:
         """
         检测索引循环模式：
@@ -429,7 +868,7 @@ class PythonInterpreter:
 
                     container_name = range_arg.args[0].id
                     range_pattern = 'simple'
-                    print(f"🔍 [Pattern Detection] Found range(len({container_name})) pattern")
+                    logger.debug("🔍 [Pattern Detection] Found range(len(%s)) pattern", container_name)
 
             # 模式2：range(start, len(container)) - 双参数（双指针模式）
             elif len(range_args) == 2:
@@ -447,22 +886,20 @@ class PythonInterpreter:
 
                     # 分析起始参数（如 i+1）
                     start_expr = self._analyze_range_start_expression(start_arg)
-                    print(f"🔍 [Pattern Detection] Found range({start_expr}, len({container_name})) dual-pointer pattern")
+                    logger.debug("🔍 [Pattern Detection] Found range(%s, len(%s)) dual-pointer pattern", start_expr, container_name)
 
             if container_name and range_pattern:
                 # 分析循环体内的索引访问模式
-                analyzer = IndexAccessAnalyzer(iterator_var_name)
-                for stmt in for_node.body:
-                    analyzer.visit(stmt)
+                container_accesses = IndexAccessAnalyzer.analyze_loop(for_node, iterator_var_name)
 
                 # 检查是否有对应的container[index]访问
                 matching_accesses = [
-                    access for access in analyzer.container_accesses
+                    access for access in container_accesses
                     if access['container'] == container_name
                 ]
 
                 if matching_accesses:
-                    print(f"🔍 [Pattern Detection] Found {len(matching_accesses)} matching accesses: {container_name}[{iterator_var_name}]")
+                    logger.debug("🔍 [Pattern Detection] Found %s matching accesses: %s[%s]", len(matching_accesses), container_name, iterator_var_name)
                     return {
                         'container': container_name,
                         'index_var': iterator_var_name,
@@ -470,7 +907,7 @@ class PythonInterpreter:
                         'accesses': matching_accesses
                     }
                 else:
-                    print(f"🔍 [Pattern Detection] No matching {container_name}[{iterator_var_name}] accesses found in loop body")
+                    logger.debug("🔍 [Pattern Detection] No matching %s[%s] accesses found in loop body", container_name, iterator_var_name)
 
         return None
 
@@ -491,15 +928,14 @@ class PythonInterpreter:
 
     def _detect_and_record_multi_index_access(self, container_name: str):
         """检测并记录对同一容器的多索引访问（双指针模式）"""
-        if not self.hook.iteration_stack:
+        # 钩子按容器名索引循环上下文，只有一层循环遍历该容器时直接返回
+        contexts = self.hook.get_container_contexts(container_name)
+        if len(contexts) < 2:
             return
 
         # 收集所有访问该容器的循环上下文
-        accessing_contexts = []
-        for context in self.hook.iteration_stack:
-            if (context.get('container') == container_name and
-                context.get('current_index', -1) >= 0):  # 确保已开始遍历
-                accessing_contexts.append(context)
+        accessing_contexts = [context for context in contexts
+                              if context.current_index >= 0]  # 确保已开始遍历
 
         # 如果有多个上下文访问同一容器，记录多索引访问
         if len(accessing_contexts) >= 2:
@@ -507,12 +943,14 @@ class PythonInterpreter:
             index_vars = []
 
             for context in accessing_contexts:
-                indices.append(context['current_index'])
-                index_vars.append(context['iterator_var'])
+                indices.append(context.current_index)
+                index_vars.append(context.iterator_var)
 
             # 记录多索引访问
             self.hook.record_multi_index_access(container_name, indices, index_vars)
-            print(f"🔄 [Multi-Index Detection] Found {len(accessing_contexts)} simultaneous accesses to {container_name}: {dict(zip(index_vars, indices))}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔄 [Multi-Index Detection] Found %d simultaneous accesses to %s: %s",
+                             len(accessing_contexts), container_name, dict(zip(index_vars, indices)))
 
     def _detect_slice_access(self, container_name: str, slice_node: ast.Slice):
         """检测切片操作中的迭代变量使用"""
@@ -528,24 +966,22 @@ class PythonInterpreter:
         if isinstance(slice_node.lower, ast.Name):
             start_var = slice_node.lower.id
             # 查找这个变量是否是当前的迭代变量
-            for context in self.hook.iteration_stack:
-                if context['iterator_var'] == start_var and context.get('current_index', -1) >= 0:
-                    start_idx = context['current_index']
-                    break
+            context = self.hook.get_iteration_context(start_var)
+            if context and context.current_index >= 0:
+                start_idx = context.current_index
 
         # 检查end位置
         if isinstance(slice_node.upper, ast.Name):
             end_var = slice_node.upper.id
             # 查找这个变量是否是当前的迭代变量
-            for context in self.hook.iteration_stack:
-                if context['iterator_var'] == end_var and context.get('current_index', -1) >= 0:
-                    end_idx = context['current_index']
-                    break
+            context = self.hook.get_iteration_context(end_var)
+            if context and context.current_index >= 0:
+                end_idx = context.current_index
 
         # 如果start和end都是迭代变量，记录切片访问
         if start_var and end_var and start_idx is not None and end_idx is not None:
             self.hook.record_slice_access(container_name, start_idx, end_idx, start_var, end_var)
-            print(f"🔄 [Slice Detection] Found slice access: {container_name}[{start_var}:{end_var}] = {container_name}[{start_idx}:{end_idx}]")
+            logger.debug("🔄 [Slice Detection] Found slice access: %s[%s:%s] = %s[%s:%s]", container_name, start_var, end_var, container_name, start_idx, end_idx)
 
     def execute_Break(self, node: ast.Break) -> None:
         """执行break语句"""
@@ -567,60 +1003,144 @@ class PythonInterpreter:
         """执行常量节点"""
         return node.value
 
-    def execute_Num(self, node: ast.Num) -> Union[int, float]:
-        """执行数字节点（Python < 3.8 兼容性）"""
-        return node.n
-
-    def execute_Str(self, node: ast.Str) -> str:
-        """执行字符串节点（Python < 3.8 兼容性）"""
-        return node.s
-
     def execute_JoinedStr(self, node: ast.JoinedStr) -> str:
         """执行f-string节点"""
-        result = ""
+        try:
+            segments = node._segments
+        except AttributeError:
+            segments = node._segments = self._joined_str_segments(node)
+
+        parts = []
+        append = parts.append
+        for text, expr, thunk in segments:
+            if expr is None:
+                append(text)
+            else:
+                # 简化处理，忽略格式化规范
+                append(str(thunk(self) if thunk is not None else self.execute(expr)))
+        return ''.join(parts)
+
+    @staticmethod
+    def _joined_str_segments(node: ast.JoinedStr) -> tuple:
+        """预处理f-string：常量段预先转为字符串，表达式段尽量编译为闭包；每段为 (文本, 表达式, 闭包)"""
+        segments = []
         for value in node.values:
             if isinstance(value, ast.Constant):
-                result += str(value.value)
-            elif isinstance(value, ast.Str):
-                result += value.s
-            elif isinstance(value, ast.FormattedValue):
-                # 执行表达式并格式化
-                expr_result = self.execute(value.value)
-                if value.format_spec:
-                    # 简化处理，忽略复杂的格式化规范
-                    result += str(expr_result)
-                else:
-                    result += str(expr_result)
+                segments.append((str(value.value), None, None))
             else:
-                result += str(self.execute(value))
-        return result
+                expr = value.value if isinstance(value, ast.FormattedValue) else value
+                segments.append((None, expr, _compile_expr(expr)))
+        return tuple(segments)
 
     def execute_FormattedValue(self, node: ast.FormattedValue) -> str:
         """执行格式化值节点"""
         return str(self.execute(node.value))
 
     def execute_List(self, node: ast.List) -> List:
-        """执行列表节点"""
-        return [self.execute(elt) for elt in node.elts]
+        """执行列表节点：常量元素来自预先构建的模板，只计算非常量元素"""
+        try:
+            template, dynamic = node._template
+        except AttributeError:
+            template, dynamic = node._template = self._list_template(node)
+
+        result = template.copy()
+        for index, expr, thunk in dynamic:
+            result[index] = thunk(self) if thunk is not None else self.execute(expr)
+        return result
 
     def execute_Dict(self, node: ast.Dict) -> Dict:
-        """执行字典节点"""
+        """执行字典节点：键都是常量时从预先构建的模板复制，只计算非常量的值"""
+        try:
+            template, items = node._template
+        except AttributeError:
+            template, items = node._template = self._dict_template(node)
+
+        if template is not None:
+            result = template.copy()
+            for key, expr, thunk in items:
+                result[key] = thunk(self) if thunk is not None else self.execute(expr)
+            return result
+
         result = {}
-        for key, value in zip(node.keys, node.values):
-            result[self.execute(key)] = self.execute(value)
+        for key_slot, (value, value_expr, value_thunk) in items:
+            if value_expr is not None:
+                value = value_thunk(self) if value_thunk is not None else self.execute(value_expr)
+            if key_slot is None:
+                # {**mapping} 解包
+                result.update(value)
+                continue
+            key, key_expr, key_thunk = key_slot
+            if key_expr is not None:
+                key = key_thunk(self) if key_thunk is not None else self.execute(key_expr)
+            result[key] = value
         return result
 
+    @staticmethod
+    def _dict_template(node: ast.Dict) -> tuple:
+        """构建字典模板：键都是不重复的常量时返回 (填好常量值的字典, 非常量值的 (键, 表达式, 闭包))，
+        否则返回 (None, 每项的 (键槽位或None, 值槽位))"""
+        keys = [key.value for key in node.keys if isinstance(key, ast.Constant)]
+        if len(keys) == len(node.keys) and len(set(keys)) == len(keys):
+            template = {}
+            dynamic = []
+            for key, value_node in zip(keys, node.values):
+                value, expr, thunk = _slot(value_node)
+                template[key] = value
+                if expr is not None:
+                    dynamic.append((key, expr, thunk))
+            return template, tuple(dynamic)
+
+        return None, tuple((None if key is None else _slot(key), _slot(value))
+                           for key, value in zip(node.keys, node.values))
+
+    @staticmethod
+    def _list_template(node: ast.List) -> tuple:
+        """构建列表模板：(常量位置已填好的列表, 非常量元素的 (位置, 表达式, 闭包))"""
+        template = []
+        dynamic = []
+        for index, elt in enumerate(node.elts):
+            value, expr, thunk = _slot(elt)
+            template.append(value)
+            if expr is not None:
+                dynamic.append((index, expr, thunk))
+        return template, tuple(dynamic)
+
     def execute_Subscript(self, node: ast.Subscript) -> Any:
-        """执行下标访问"""
+        """执行下标访问：下标的结构预先整理并缓存在节点上"""
         obj = self.execute(node.value)
+        try:
+            key_thunk, bounds, container_name = node._key
+        except AttributeError:
+            key_thunk, bounds, container_name = node._key = self._subscript_key(node)
+
+        if bounds is None:
+            # 普通下标：纯表达式直接调用闭包
+            return obj[key_thunk(self) if key_thunk is not None else self.execute(node.slice)]
 
         # 检测切片操作中的双指针模式
-        if isinstance(node.slice, ast.Slice) and isinstance(node.value, ast.Name):
-            container_name = node.value.id
+        if container_name is not None:
             self._detect_slice_access(container_name, node.slice)
 
-        key = self.execute(node.slice)
-        return obj[key]
+        values = []
+        for bound in bounds:
+            if bound is None:
+                values.append(None)
+            else:
+                expr, thunk = bound
+                values.append(thunk(self) if thunk is not None else self.execute(expr))
+        return obj[slice(*values)]
+
+    @staticmethod
+    def _subscript_key(node: ast.Subscript) -> tuple:
+        """整理下标：返回 (下标闭包, 切片三个部分的 (节点, 闭包) 或None, 切片所属的容器名)，普通下标时后两项为None"""
+        key = node.slice
+        if not isinstance(key, ast.Slice):
+            return _compile_expr(key), None, None
+
+        bounds = tuple(None if part is None else (part, _compile_expr(part))
+                       for part in (key.lower, key.upper, key.step))
+        container_name = node.value.id if isinstance(node.value, ast.Name) else None
+        return None, bounds, container_name
 
     def execute_Slice(self, node: ast.Slice) -> slice:
         """执行切片操作"""
@@ -639,58 +1159,71 @@ class PythonInterpreter:
 
     def execute_Attribute(self, node: ast.Attribute) -> Any:
         """执行属性访问"""
-        obj = self.execute(node.value)
-        return getattr(obj, node.attr)
+        return self._get_attribute(self.execute(node.value), node.attr)
+
+    @staticmethod
+    def _get_attribute(obj: Any, name: str) -> Any:
+        """读取属性，自定义对象按实例属性、类属性的顺序查找"""
+        if isinstance(obj, PythonObject):
+            return obj.get_attribute(name)
+        return getattr(obj, name)
 
     def execute_Call(self, node: ast.Call) -> Any:
         """执行函数调用"""
-        # 检测动画操作（在执行前）
-        animation_data = self._detect_animation_operation(node)
-
-        func = self.execute(node.func)
-        args = [self.execute(arg) for arg in node.args]
-        kwargs = {kw.arg: self.execute(kw.value) for kw in node.keywords}
-
-        result = func(*args, **kwargs)
+        method = None
+        func_node = node.func
+        # 检测动画操作（在执行前）；只有方法调用才可能有动画，普通函数调用不查模板
+        animation_data = self._detect_animation_operation(node) if type(func_node) is ast.Attribute else None
+
+        if type(func_node) is ast.Attribute and func_node.attr in _FAST_METHOD_NAMES:
+            # 常见容器方法直接调用未绑定的方法，避免每次创建绑定方法对象
+            obj = self.execute(func_node.value)
+            method = _FAST_METHODS.get((type(obj), func_node.attr))
+            if method is None:
+                func = self._get_attribute(obj, func_node.attr)
+        else:
+            func = self.execute(func_node)
+        try:
+            arg_slots = node._arg_slots
+        except AttributeError:
+            arg_slots = node._arg_slots = tuple((arg, _compile_expr(arg)) for arg in node.args)
+        args = [thunk(self) if thunk is not None else self.execute(arg) for arg, thunk in arg_slots]
+
+        if node.keywords:
+            kwargs = {kw.arg: self.execute(kw.value) for kw in node.keywords}
+            result = method(obj, *args, **kwargs) if method is not None else func(*args, **kwargs)
+        else:
+            # 大多数调用没有关键字参数，不构建空的kwargs字典
+            result = method(obj, *args) if method is not None else func(*args)
+        # 调用可能原地修改了容器
+        self._serialized_containers.clear()
 
         # 如果检测到动画操作，记录动画信息（仅在真正执行完成后）
         if animation_data:
-            # 创建动画标识符，防止同一行重复录制
+            # 来源变量在执行时才确定，标识符按本次的动画数据构建
             animation_key = (
-                animation_data.get('line'),
-                animation_data.get('operation'),
+                animation_data['line'],
+                animation_data['operation'],
                 animation_data.get('source_variable'),
-                animation_data.get('target_variable')
+                animation_data['target_variable']
             )
-
-            if animation_key not in self.recorded_animations_this_step:
-                animation_data['completed'] = True
-                # 添加执行步骤计数来确保唯一性
-                animation_data['step_count'] = self.hook.step_count
-                print(f"🔧 [Debug] Recording Call animation: {animation_data}")
-                self.hook.record_animation_step(animation_data)
-                self.recorded_animations_this_step.add(animation_key)
-            else:
-                print(f"🔧 [Debug] Skipping duplicate Call animation in same step: {animation_key}")
+            self._record_animation(animation_data, animation_key, 'Call')
 
         return result
 
     def execute_BinOp(self, node: ast.BinOp) -> Any:
         """执行二元运算"""
+        thunk = _compile_expr(node)
+        if thunk is not None:
+            return thunk(self)
+
         left = self.execute(node.left)
         right = self.execute(node.right)
 
-        op_map = {
-            ast.Add: lambda x, y: x + y,
-            ast.Sub: lambda x, y: x - y,
-            ast.Mult: lambda x, y: x * y,
-            ast.Div: lambda x, y: x / y,
-            ast.FloorDiv: lambda x, y: x // y,
-            ast.Mod: lambda x, y: x % y,
-            ast.Pow: lambda x, y: x ** y,
-        }
-
-        op_func = op_map.get(type(node.op))
+        try:
+            op_func = node._op_fn
+        except AttributeError:
+            op_func = node._op_fn = _BINOPS.get(type(node.op))
         if op_func:
             return op_func(left, right)
 
@@ -698,15 +1231,16 @@ class PythonInterpreter:
 
     def execute_UnaryOp(self, node: ast.UnaryOp) -> Any:
         """执行一元运算"""
-        operand = self.execute(node.operand)
+        thunk = _compile_expr(node)
+        if thunk is not None:
+            return thunk(self)
 
-        op_map = {
-            ast.UAdd: lambda x: +x,
-            ast.USub: lambda x: -x,
-            ast.Not: lambda x: not x,
-        }
+        operand = self.execute(node.operand)
 
-        op_func = op_map.get(type(node.op))
+        try:
+            op_func = node._op_fn
+        except AttributeError:
+            op_func = node._op_fn = _UNOPS.get(type(node.op))
         if op_func:
             return op_func(operand)
 
@@ -714,91 +1248,160 @@ class PythonInterpreter:
 
     def execute_Compare(self, node: ast.Compare) -> bool:
         """执行比较运算"""
-        left = self.execute(node.left)
-
-        op_map = {
-            ast.Eq: lambda x, y: x == y,
-            ast.NotEq: lambda x, y: x != y,
-            ast.Lt: lambda x, y: x < y,
-            ast.LtE: lambda x, y: x <= y,
-            ast.Gt: lambda x, y: x > y,
-            ast.GtE: lambda x, y: x >= y,
-            ast.Is: lambda x, y: x is y,
-            ast.IsNot: lambda x, y: x is not y,
-            ast.In: lambda x, y: x in y,
-            ast.NotIn: lambda x, y: x not in y,
-        }
-
-        for op, right_node in zip(node.ops, node.comparators):
-            right = self.execute(right_node)
-            op_func = op_map.get(type(op))
-            if not op_func:
-                raise NotImplementedError(f"Comparison operator {type(op).__name__} not implemented")
+        thunk = _compile_expr(node)
+        if thunk is not None:
+            return thunk(self)
 
+        # 含调用、下标等的比较：运算符和右侧操作数预先整理成链，缓存在节点上
+        try:
+            chain = node._chain
+        except AttributeError:
+            chain = node._chain = self._compare_chain(node)
+
+        execute = self.execute
+        left = execute(node.left)
+        if len(chain) == 1:
+            # 最常见的单个比较：展开循环
+            (op_func, right_node, right_thunk), = chain
+            right = right_thunk(self) if right_thunk is not None else execute(right_node)
+            return True if op_func(left, right) else False
+
+        for op_func, right_node, right_thunk in chain:
+            right = right_thunk(self) if right_thunk is not None else execute(right_node)
             if not op_func(left, right):
                 return False
             left = right  # Chain comparisons
 
         return True
 
-    def execute_BoolOp(self, node: ast.BoolOp) -> bool:
-        """执行布尔运算"""
-        if isinstance(node.op, ast.And):
-            for value in node.values:
-                if not self.execute(value):
-                    return False
-            return True
-        elif isinstance(node.op, ast.Or):
-            for value in node.values:
-                if self.execute(value):
-                    return True
-            return False
+    @staticmethod
+    def _compare_chain(node: ast.Compare) -> tuple:
+        """整理比较链：每项为 (运算函数, 右侧节点, 右侧闭包或None)"""
+        chain = []
+        for op, right_node in zip(node.ops, node.comparators):
+            op_func = _CMPOPS.get(type(op))
+            if op_func is None:
+                raise NotImplementedError(f"Comparison operator {type(op).__name__} not implemented")
+            chain.append((op_func, right_node, _compile_expr(right_node)))
+        return tuple(chain)
 
-    def get_all_variables(self) -> Dict[str, Any]:
-        """获取所有变量（用于可视化）"""
-        variables = {
-            'global': {},
-            'local': {}
-        }
+    def execute_BoolOp(self, node: ast.BoolOp) -> Any:
+        """执行布尔运算：短路求值，返回决定结果的那个操作数"""
+        thunk = _compile_expr(node)
+        if thunk is not None:
+            return thunk(self)
+
+        execute = self.execute
+        try:
+            is_and = node._is_and
+        except AttributeError:
+            is_and = node._is_and = isinstance(node.op, ast.And)
 
-        # 添加全局变量
-        for name, value in self.global_scope.items():
-            if not name.startswith('__') and not callable(value):
-                variables['global'][name] = self._serialize_value(value)
+        if is_and:
+            for value in node.values:
+                result = execute(value)
+                if not result:
+                    return result
+            return result
 
-        # 添加当前局部变量（最新的作用域）
-        if self.local_scopes:
-            current_scope = self.local_scopes[-1]
-            for name, value in current_scope.items():
-                if not name.startswith('__') and not callable(value):
-                    variables['local'][name] = self._serialize_value(value)
+        for value in node.values:
+            result = execute(value)
+            if result:
+                return result
+        return result
 
+    def get_all_variables(self) -> Dict[str, Any]:
+        """获取所有变量（用于可视化）"""
+        memo = self._serialized_containers  # 同一对象只序列化一次，且在没有修改操作的步骤之间复用
+        # 全局变量和当前局部变量（最新的作用域）
+        global_vars = self._serialize_scope(self.global_scope, self._global_serialized, memo)
+        local_vars = (self._serialize_scope(self.local_scopes[-1], self._local_serialized, memo)
+                      if self.local_scopes else {})
+        return self._shared_snapshot(global_vars, local_vars)
+
+    def _shared_snapshot(self, global_vars: Dict[str, Any], local_vars: Dict[str, Any]) -> Dict[str, Any]:
+        """写时复制的变量快照：与上一次逐项相同的作用域复用上一次的字典，都未变化时复用整个快照，
+        步骤历史中未变化的步骤不再各自持有一份变量表"""
+        last = self._last_variables
+        if last is not None:
+            if _same_entries(global_vars, last['global']):
+                global_vars = last['global']
+            if _same_entries(local_vars, last['local']):
+                local_vars = last['local']
+            if global_vars is last['global'] and local_vars is last['local']:
+                return last
+        variables = {'global': global_vars, 'local': local_vars}
+        self._last_variables = variables
         return variables
 
-    def _serialize_value(self, value: Any) -> Dict[str, Any]:
-        """序列化值用于JSON传输"""
+    def _serialize_scope(self, scope: Dict[str, Any], cache: Dict[str, tuple], memo: Dict[int, tuple]) -> Dict[str, Any]:
+        """序列化一个作用域；值未变化的标量直接复用上次的序列化结果，容器通过memo复用"""
+        result = {}
+        for name, value in scope.items():
+            if name.startswith('__') or callable(value):
+                continue
+            value_type = type(value)
+            if value_type in _SCALAR_TYPES:
+                cached = cache.get(name)
+                if (cached is not None and type(cached[0]) is value_type and
+                        (cached[0] is value or (value_type is not float and cached[0] == value))):
+                    result[name] = cached[1]
+                    continue
+                entry = self._serialize_value(value)
+                cache[name] = (value, entry)
+            else:
+                entry = self._serialize_value(value, memo)
+            result[name] = entry
+        return result
+
+    def _serialize_value(self, value: Any, _memo: Dict[int, tuple] = None) -> Dict[str, Any]:
+        """序列化值用于JSON传输（容器按id记忆并持有引用防止id被复用，同时避免自引用导致的无限递归）"""
         if isinstance(value, (int, float, str, bool)) or value is None:
             return {
                 'type': type(value).__name__ if value is not None else 'NoneType',
                 'value': value,
                 'display': str(value)
             }
-        elif isinstance(value, list):
-            return {
+
+        if _memo is None:
+            _memo = {}
+        key = id(value)
+        hit = _memo.get(key)
+        if hit is not None:
+            return hit[1]
+
+        if isinstance(value, list):
+            # 先放入占位结果，自引用的元素序列化为None
+            _memo[key] = (value, {'type': 'list', 'value': None, 'display': '[...]'})
+            # 一次遍历前10个元素，同时得到序列化结果和前3个元素的显示文本
+            length = len(value)
+            items, shown = [], []
+            for index, item in enumerate(islice(value, 10)):  # 限制长度
+                items.append(self._serialize_value(item, _memo)['value'])
+                if index < 3:
+                    shown.append(str(item))
+            result = {
                 'type': 'list',
-                'value': [self._serialize_value(item)['value'] for item in value[:10]],  # 限制长度
-                'display': f"[{', '.join(str(item) for item in value[:3])}{'...' if len(value) > 3 else ''}]",
-                'length': len(value)
+                'value': items,
+                'display': f"[{', '.join(shown)}{'...' if length > 3 else ''}]",
+                'length': length
             }
         elif isinstance(value, dict):
-            return {
+            _memo[key] = (value, {'type': 'dict', 'value': None, 'display': '{...}'})
+            length = len(value)
+            items, shown = {}, []
+            for index, (k, v) in enumerate(islice(value.items(), 5)):
+                items[str(k)] = self._serialize_value(v, _memo)['value']
+                if index < 2:
+                    shown.append(f'{k}: {v}')
+            result = {
                 'type': 'dict',
-                'value': {str(k): self._serialize_value(v)['value'] for k, v in list(value.items())[:5]},
-                'display': f"{{{', '.join(f'{k}: {v}' for k, v in list(value.items())[:2])}{('...' if len(value) > 2 else '')}}}",
-                'length': len(value)
+                'value': items,
+                'display': f"{{{', '.join(shown)}{('...' if length > 2 else '')}}}",
+                'length': length
             }
         elif isinstance(value, PythonObject):
-            return {
+            result = {
                 'type': value.class_name,
                 'value': value.attributes,
                 'display': f"<{value.class_name} object>"
@@ -810,119 +1413,90 @@ class PythonInterpreter:
                 'display': str(value)
             }
 
+        _memo[key] = (value, result)
+        return result
+
+    def _record_animation(self, animation_data: Dict[str, Any], animation_key: tuple, kind: str):
+        """记录一次动画，同一步骤中标识符相同的动画只记录一次"""
+        if animation_key in self._step_anim_keys:
+            logger.debug("🔧 [Debug] Skipping duplicate %s animation in same step: %s", kind, animation_key)
+            return
+
+        animation_data['completed'] = True
+        # 添加执行步骤计数来确保唯一性
+        animation_data['step_count'] = self.hook.step_count
+        logger.debug("🔧 [Debug] Recording %s animation: %s", kind, animation_data)
+        self.hook.record_animation_step(animation_data)
+        self._step_anim_keys.add(animation_key)
+
     def _detect_assignment_animation(self, node: ast.Assign) -> Optional[Dict[str, Any]]:
-        """检测赋值操作中的动画，如 dict[key] = variable"""
+        """检测赋值操作中的动画，如 dict[key] = variable（静态部分和动画标识符在解析时已挂在节点上，其他来源的AST首次执行时构建）"""
         try:
-            # 检查是否是从变量赋值
-            if isinstance(node.value, ast.Name):
-                source_var = node.value.id
-                try:
-                    source_value = self.get_variable(source_var)
-                except NameError:
-                    return None
-
-                # 检查目标是否是下标赋值 (obj[key] = var)
-                for target in node.targets:
-                    if isinstance(target, ast.Subscript):
-                        target_obj = self._get_variable_name_from_node(target.value)
-                        if target_obj:
-                            return {
-                                'type': 'value_transfer',
-                                'operation': 'assignment',
-                                'source_variable': source_var,
-                                'source_value': source_value,
-                                'target_variable': target_obj,
-                                'line': node.lineno,
-                                'animation_type': 'assignment_operation',
-                                'step_count': self.hook.step_count  # 添加步骤计数
-                            }
-
+            template, _ = node._anim_template
+        except AttributeError:
+            template, _ = node._anim_template = assignment_animation_template(node)
+        if template is None:
             return None
-        except Exception as e:
-            print(f"Assignment animation detection error: {e}")
+
+        source_value = self._lookup_variable(template['source_variable'])
+        if source_value is _MISSING:
             return None
+        return dict(template, source_value=source_value, step_count=self.hook.step_count)
 
     def _detect_animation_operation(self, node: ast.Call) -> Optional[Dict[str, Any]]:
-        """检测动画操作，如 list.append(variable), dict[key] = variable 等"""
+        """检测动画操作，如 list.append(variable), dict.update(...) 等（静态部分在解析时已挂在节点上，其他来源的AST首次执行时构建）"""
         try:
-            # 检测方法调用，如 list.append(var)
-            if isinstance(node.func, ast.Attribute):
-                attr_name = node.func.attr
-
-                # 检测 list/array 操作
-                if attr_name in ['append', 'insert', 'extend'] and len(node.args) > 0:
-                    # 获取目标对象名（如 list_name）
-                    target_obj = self._get_variable_name_from_node(node.func.value)
-                    if target_obj:
-                        # 获取源变量名（传入的参数）
-                        source_var = None
-                        source_value = None
-
-                        for arg in node.args:
-                            if isinstance(arg, ast.Name):
-                                source_var = arg.id
-                                try:
-                                    source_value = self.get_variable(arg.id)
-                                except NameError:
-                                    continue
-                                break
-                            elif isinstance(arg, ast.Constant):
-                                source_value = arg.value
-                                break
-                            elif isinstance(arg, ast.Subscript):
-                                # 处理切片操作，如 a[1:3]
-                                if isinstance(arg.value, ast.Name):
-                                    source_var = arg.value.id
-                                    try:
-                                        # 计算切片表达式的值
-                                        source_value = self.execute(arg)
-                                    except Exception as e:
-                                        print(f"Error evaluating slice expression: {e}")
-                                        continue
-                                    break
-
-                        if source_var or source_value is not None:
-                            return {
-                                'type': 'value_transfer',
-                                'operation': attr_name,
-                                'source_variable': source_var,
-                                'source_value': source_value,
-                                'target_variable': target_obj,
-                                'line': node.lineno,
-                                'animation_type': 'list_operation',
-                                'step_count': self.hook.step_count  # 添加步骤计数
-                            }
-
-                # 检测字典操作等其他方法调用
-                elif attr_name in ['update', 'setdefault']:
-                    target_obj = self._get_variable_name_from_node(node.func.value)
-                    if target_obj and len(node.args) > 0:
-                        return {
-                            'type': 'value_transfer',
-                            'operation': attr_name,
-                            'target_variable': target_obj,
-                            'line': node.lineno,
-                            'animation_type': 'dict_operation',
-                            'step_count': self.hook.step_count  # 添加步骤计数
-                        }
-
-            return None
-        except Exception as e:
-            # 如果检测失败，不影响正常执行
-            print(f"Animation detection error: {e}")
+            template, sources = node._anim_template
+        except AttributeError:
+            template, sources = node._anim_template = call_animation_template(node)
+        if template is None:
             return None
 
+        if sources is None:
+            # 字典操作：没有需要在执行时求值的来源
+            return dict(template, step_count=self.hook.step_count)
+
+        # 获取源变量名（传入的参数）
+        source_var = None
+        source_value = None
+        for kind, name, arg in sources:
+            if kind == 'name':
+                source_var = name
+                value = self._lookup_variable(name)
+                if value is _MISSING:
+                    continue
+                source_value = value
+                break
+            elif kind == 'constant':
+                source_value = arg.value
+                break
+            else:
+                # 处理下标和切片操作，如 a[i]、a[1:3]；容器未定义时跳过。
+                # 其他求值错误（如越界）与随后调用时对同一参数求值的错误相同，直接抛出
+                source_var = name
+                if self._lookup_variable(name) is _MISSING:
+                    continue
+                source_value = self.execute(arg)
+                break
+
+        if source_var or source_value is not None:
+            return dict(template, source_variable=source_var, source_value=source_value,
+                        step_count=self.hook.step_count)
+        return None
+
     def _get_variable_name_from_node(self, node: ast.AST) -> Optional[str]:
         """从AST节点中提取变量名"""
-        if isinstance(node, ast.Name):
-            return node.id
-        elif isinstance(node, ast.Attribute):
-            # 对于类似 obj.attr 的情况，返回 obj
-            base_name = self._get_variable_name_from_node(node.value)
-            if base_name:
-                return f"{base_name}.{node.attr}"
-        elif isinstance(node, ast.Subscript):
-            # 对于类似 obj[key] 的情况，返回 obj
-            return self._get_variable_name_from_node(node.value)
-
-        return None
\ No newline at end of file
+        return variable_name(node)
+
+# 节点类型 -> (执行方法, 是否记录步骤)，按 execute_<节点类型名> 的命名约定在类定义后构建一次，
+# execute() 一次字典查找即可同时得到两者
+PythonInterpreter._DISPATCH = {
+    node_type: (method, node_type in PythonInterpreter._TRACKED_TYPES)
+    for node_type, method in (
+        (vars(ast).get(name[len('execute_'):]), method)
+        for name, method in vars(PythonInterpreter).items()
+        if name.startswith('execute_')
+    )
+    if isinstance(node_type, type)
+}
+PythonInterpreter._GENERIC_ENTRY = (PythonInterpreter.execute_generic, False)
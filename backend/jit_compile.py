@@ -0,0 +1,199 @@
+"""
+原生循环编译 - 把只含数值运算的for循环和函数编译为CPython字节码直接执行
+"""
+import ast
+import textwrap
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
+
+from ast_parser import USER_CODE_FILENAME
+
+NATIVE_LOOP_NAME = '__native_loop__'
+_LOCALS_NAME = '__native_locals__'
+
+# 允许出现在原生循环中的节点类型
+_ALLOWED_NODES = frozenset({
+    ast.For, ast.If, ast.Assign, ast.AugAssign, ast.Break, ast.Continue, ast.Pass,
+    ast.Name, ast.Constant, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call,
+    ast.Load, ast.Store,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.BitAnd, ast.BitOr, ast.BitXor, ast.LShift, ast.RShift,
+    ast.UAdd, ast.USub, ast.Not, ast.Invert,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+})
+
+# 原生函数中额外允许的节点类型
+_FUNCTION_NODES = _ALLOWED_NODES | frozenset({ast.While, ast.Return})
+
+# 原生函数中可以调用的内置函数
+_FUNCTION_BUILTINS = {'range': range, 'abs': abs, 'min': min, 'max': max}
+
+_NUMERIC_TYPES = (int, float, bool)
+
+def analyze(node: ast.For) -> Optional[Tuple[FrozenSet[str], FrozenSet[str]]]:
+    """检查循环能否原生执行，能则返回(读取的变量名, 赋值的变量名)，否则返回None；结果缓存在节点上"""
+    try:
+        return node._native_names
+    except AttributeError:
+        pass
+    names = _collect_names(node)
+    node._native_names = names
+    return names
+
+def _collect_names(node: ast.AST, allowed: FrozenSet[type] = _ALLOWED_NODES,
+                   calls: FrozenSet[str] = frozenset()) -> Optional[Tuple[FrozenSet[str], FrozenSet[str]]]:
+    """遍历循环或函数体子树，遇到不支持的节点时返回None；calls 为允许直接调用的函数名"""
+    loaded, stored = set(), set()
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        node_type = type(current)
+        if node_type not in allowed:
+            return None
+
+        if node_type is ast.For:
+            # 只支持 for 变量 in range(...)，循环次数有限
+            iterator = current.iter
+            if (not isinstance(current.target, ast.Name) or current.orelse or
+                    not isinstance(iterator, ast.Call) or not isinstance(iterator.func, ast.Name) or
+                    iterator.func.id != 'range' or iterator.keywords):
+                return None
+            loaded.add(iterator.func.id)  # 函数中需要据此绑定 range
+            stack.extend(iterator.args)
+            stack.append(current.target)
+            stack.extend(current.body)
+            continue
+
+        if node_type is ast.Call:
+            # 循环中 range 调用只能出现在 for 的迭代位置；函数中只能调用 calls 里的函数
+            func = current.func
+            if not isinstance(func, ast.Name) or func.id not in calls or current.keywords:
+                return None
+        elif node_type is ast.While:
+            if current.orelse:
+                return None
+
+        if node_type is ast.Assign:
+            if not all(isinstance(target, ast.Name) for target in current.targets):
+                return None
+        elif node_type is ast.AugAssign:
+            if not isinstance(current.target, ast.Name):
+                return None
+            loaded.add(current.target.id)
+        elif node_type is ast.Constant:
+            if type(current.value) not in _NUMERIC_TYPES:
+                return None
+        elif node_type is ast.Name:
+            if current.id.startswith('__native_'):
+                return None
+            (stored if isinstance(current.ctx, ast.Store) else loaded).add(current.id)
+
+        stack.extend(ast.iter_child_nodes(current))
+
+    if 'range' in stored or stored & calls:
+        return None
+    return frozenset(loaded), frozenset(stored)
+
+def _build(node: ast.For, params: Tuple[str, ...]) -> Callable[..., Dict[str, Any]]:
+    """把循环包装成函数并编译，循环变量都成为函数的局部变量"""
+    source = (f"def {NATIVE_LOOP_NAME}({', '.join(params)}):\n"
+              f"{textwrap.indent(ast.unparse(node), '    ')}\n"
+              f"    return {_LOCALS_NAME}()\n")
+    namespace = {'__builtins__': {}, 'range': range, _LOCALS_NAME: locals}
+    exec(compile(source, USER_CODE_FILENAME, 'exec'), namespace)
+    return namespace[NATIVE_LOOP_NAME]
+
+def prepare(node: ast.For, resolve: Callable[[str], Any]) -> Optional[Callable[[], Dict[str, Any]]]:
+    """准备原生执行：变量都是数值时返回无参函数，调用后得到循环中赋值的变量；否则返回None"""
+    names = analyze(node)
+    if names is None:
+        return None
+    loaded, stored = names
+
+    try:
+        if resolve('range') is not range:
+            return None
+    except NameError:
+        return None
+
+    args = {}
+    for name in loaded:
+        if name == 'range':
+            continue
+        try:
+            value = resolve(name)
+        except NameError:
+            if name in stored:
+                continue  # 在循环中先赋值后读取
+            return None
+        if type(value) not in _NUMERIC_TYPES:
+            return None
+        args[name] = value
+
+    params = tuple(sorted(args))
+    cache = node.__dict__.setdefault('_native_funcs', {})
+    func = cache.get(params)
+    if func is None:
+        func = cache[params] = _build(node, params)
+
+    def run() -> Dict[str, Any]:
+        result = func(**args)
+        return {name: value for name, value in result.items() if name in stored}
+    return run
+
+def analyze_function(node: ast.FunctionDef) -> Optional[Tuple[Callable[..., Any], FrozenSet[str]]]:
+    """检查函数能否原生执行，能则返回(编译后的函数, 需要确认的外部名称)，否则返回None；结果缓存在节点上"""
+    try:
+        return node._native_function
+    except AttributeError:
+        pass
+    compiled = _compile_function(node)
+    node._native_function = compiled
+    return compiled
+
+def _compile_function(node: ast.FunctionDef) -> Optional[Tuple[Callable[..., Any], FrozenSet[str]]]:
+    """只接受位置参数、无注解无装饰器、函数体只含数值运算的函数；允许递归调用自身"""
+    arguments = node.args
+    if (node.decorator_list or node.returns or arguments.posonlyargs or arguments.vararg or
+            arguments.kwonlyargs or arguments.kwarg or arguments.defaults or
+            any(arg.annotation for arg in arguments.args)):
+        return None
+
+    calls = frozenset(_FUNCTION_BUILTINS) | {node.name}
+    params = {arg.arg for arg in arguments.args}
+    loaded, stored = set(), set(params)
+    for stmt in node.body:
+        names = _collect_names(stmt, _FUNCTION_NODES, calls)
+        if names is None:
+            return None
+        loaded |= names[0]
+        stored |= names[1]
+
+    # 除参数和局部变量外只能引用允许调用的函数
+    free = frozenset(loaded - stored)
+    if not free <= calls or node.name in params or any(name.startswith('__native_') for name in params):
+        return None
+
+    namespace = {'__builtins__': {}, **{name: _FUNCTION_BUILTINS[name] for name in free if name != node.name}}
+    exec(compile(ast.unparse(node), USER_CODE_FILENAME, 'exec'), namespace)
+    return namespace[node.name], free
+
+def prepare_function(node: ast.FunctionDef, args: Tuple[Any, ...], resolve: Callable[[str], Any],
+                     function: Any) -> Optional[Callable[[], Any]]:
+    """准备原生调用：参数都是数值且外部名称仍指向预期对象时返回无参函数，调用后得到返回值；否则返回None"""
+    compiled = analyze_function(node)
+    if compiled is None or len(args) != len(node.args.args):
+        return None
+    func, free = compiled
+
+    if any(type(value) not in _NUMERIC_TYPES for value in args):
+        return None
+
+    for name in free:
+        expected = function if name == node.name else _FUNCTION_BUILTINS[name]
+        try:
+            if resolve(name) is not expected:
+                return None
+        except NameError:
+            return None
+
+    return lambda: func(*args)
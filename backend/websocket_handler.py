@@ -1,31 +1,146 @@
 """
 WebSocket处理器 - 处理实时通信和执行控制
 """
+from ast import literal_eval
+from flask import request
 from flask_socketio import SocketIO, emit
+import json
+import logging
 import threading
 import time
-from ast_parser import ASTParser, ExecutionHook
+
+import orjson
+
+from ast_parser import ASTParser, ExecutionHook, compile_instrumented, compile_source
 from interpreter import PythonInterpreter
 
+# 连续模式下步骤事件按批发送：每帧（约16ms）合并为一条消息，每帧最多发送一条；
+# 后台任务来不及按时发送时，攒够一批的执行线程会代为发送
+STEP_BATCH_INTERVAL = 0.016
+STEP_BATCH_SIZE = 64
+# 连续模式下变量只发送相对上一步的差异，每隔若干步发送一次完整快照作为关键帧
+VARIABLES_KEYFRAME_INTERVAL = 200
+HISTORY_KEYFRAME_INTERVAL = 100  # 执行完成时发送的步骤历史中完整快照的间隔
+
+logger = logging.getLogger(__name__)
+
+class ORJSONPacketCodec:
+    """Socket.IO 数据包的JSON编解码（接口与标准库json的dumps/loads兼容），
+    每个步骤批次只由orjson编码一次；超出64位的整数等orjson不支持的值回退到标准库"""
+
+    option = orjson.OPT_NON_STR_KEYS
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        try:
+            return orjson.dumps(obj, option=ORJSONPacketCodec.option).decode()
+        except TypeError:
+            return json.dumps(obj, *args, **kwargs)
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
+
+def _variables_delta(last, variables):
+    """计算两个变量快照之间的差异 {作用域: {added, changed, removed}}，没有变化的作用域不出现"""
+    delta = {}
+    for scope, current in variables.items():
+        previous = last.get(scope) or {}
+        if current is previous or not (current or previous):
+            continue
+        added, changed = {}, {}
+        for name, entry in current.items():
+            old = previous.get(name)
+            if old is None:
+                added[name] = entry
+            elif old is not entry and old != entry:
+                # 序列化结果在未变化的步骤之间复用，先比较身份，避免对容器做深比较
+                changed[name] = entry
+        # 没有新增以外的差额时不必查找被删除的变量
+        removed = ([name for name in previous if name not in current]
+                   if len(current) - len(added) != len(previous) else [])
+        if added or changed or removed:
+            delta[scope] = {'added': added, 'changed': changed, 'removed': removed}
+    return delta
+
+def _compact_history(steps):
+    """执行完成时发送的步骤历史：变量按与上一步的差异 var_delta 发送，每隔若干步保留一次完整快照，
+    负载从 O(步数×变量数) 降为 O(变量数+变化数)"""
+    history = []
+    last = None
+    for index, step in enumerate(steps):
+        variables = step.get('variables')
+        if not variables or last is None or index % HISTORY_KEYFRAME_INTERVAL == 0:
+            encoded = step
+        else:
+            encoded = dict(step)
+            del encoded['variables']
+            encoded['var_delta'] = _variables_delta(last, variables)
+        if variables:
+            last = variables
+        history.append(encoded)
+    return history
+
 class ExecutionManager:
     """执行管理器 - 管理代码执行过程"""
 
+    __slots__ = (
+        'current_execution', 'is_running', 'pause_event', 'stop_event', 'state_changed', '_step_requested',
+        'step_mode', 'execution_thread', 'socketio', 'default_execution_delay', '_step_buffer',
+        '_step_buffer_lock', '_send_next_step_now', '_last_flush', '_last_vars_sent', '_steps_since_keyframe',
+        'is_first_step', 'last_emitted_line', 'client_sid',
+    )
+
     def __init__(self):
         self.current_execution = None
         self.is_running = False
-        self.is_paused = False
+        self.pause_event = threading.Event()  # 置位表示运行中，清除表示暂停
+        self.pause_event.set()
+        self.stop_event = threading.Event()  # 置位表示请求停止，用于打断执行延迟
+        self.state_changed = threading.Condition()  # 暂停/恢复/停止/单步时通知，唤醒执行延迟或步进等待中的线程
+        self._step_requested = False  # 步进模式下收到 step_next 后置位
         self.step_mode = False
         self.execution_thread = None
         self.socketio = None
+        self.client_sid = None  # 接收执行事件的客户端会话ID
         self.default_execution_delay = 0.3  # Default delay in seconds
-        self.step_iterator = None  # For step-by-step execution
+        self._step_buffer = []  # 待批量发送的步骤事件
+        self._step_buffer_lock = threading.Lock()  # 保护步骤缓冲区，并保证批次按顺序发送
+        self._send_next_step_now = False  # 执行开始后的第一步不等批次，立即发送
+        self._last_flush = 0.0  # 上次发送批次的时间（time.monotonic）
+        self._last_vars_sent = None  # 客户端当前持有的变量快照，None 表示下一步必须发送关键帧
+        self._steps_since_keyframe = 0
+        self.is_first_step = True  # 步进模式：第一步直接显示，不等待 step_next
+        self.last_emitted_line = None  # 步进模式：上一次等待时的行号
+
+    @property
+    def is_paused(self) -> bool:
+        """是否处于暂停状态"""
+        return not self.pause_event.is_set()
+
+    @is_paused.setter
+    def is_paused(self, paused: bool):
+        with self.state_changed:
+            if paused:
+                self.pause_event.clear()
+            else:
+                self.pause_event.set()
+            self.state_changed.notify_all()
 
     def set_socketio(self, socketio: SocketIO):
         """设置SocketIO实例"""
         self.socketio = socketio
 
-    def parse_code(self, source_code: str, inputs: str = ""):
-        """解析代码"""
+    def _emit(self, event: str, data):
+        """直接通过底层 python-socketio 服务器发送给当前客户端，跳过 Flask-SocketIO 的请求上下文处理；
+        没有记录客户端时广播"""
+        self.socketio.server.emit(event, data, to=self.client_sid, namespace='/')
+
+    def parse_code(self, source_code: str, inputs: str = "", fast_mode: bool = False, native_code: bool = False,
+                   instrumented: bool = False):
+        """解析代码（fast_mode: 连续执行时直接运行编译后的字节码，不逐步可视化；
+        native_code: 允许纯数值循环和函数整体编译执行，短程序的编译开销可能超过收益，默认关闭；
+        instrumented: 连续执行时运行插桩后的字节码，逐语句记录步骤但没有动画和索引跟踪）"""
         parser = ASTParser()
         result = parser.parse(source_code)
 
@@ -33,6 +148,7 @@ class ExecutionManager:
             # 创建执行环境
             hook = ExecutionHook()
             interpreter = PythonInterpreter(hook, execution_delay=self.default_execution_delay)
+            interpreter.native_loops = native_code
             # 设置解释器的执行管理器引用，让它能检查暂停状态
             interpreter.execution_manager = self
 
@@ -41,15 +157,15 @@ class ExecutionManager:
                 try:
                     # 简单的输入解析
                     input_vars = {}
-                    for line in inputs.strip().split('\n'):
+                    for line in inputs.splitlines():
                         if '=' in line:
                             name, value = line.split('=', 1)
                             name = name.strip()
                             value = value.strip()
-                            # 尝试解析值
+                            # 只解析字面量，不执行任意表达式；无法解析时按字符串处理
                             try:
-                                input_vars[name] = eval(value)
-                            except:
+                                input_vars[name] = literal_eval(value)
+                            except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
                                 input_vars[name] = value
 
                     # 将输入变量添加到解释器
@@ -67,7 +183,10 @@ class ExecutionManager:
                 'ast_tree': result['ast'],
                 'interpreter': interpreter,
                 'hook': hook,
-                'parser_info': result
+                'parser_info': result,
+                'source_code': source_code,
+                'fast_mode': fast_mode,
+                'instrumented': instrumented
             }
 
             return {
@@ -81,43 +200,31 @@ class ExecutionManager:
         else:
             return result
 
-    def start_execution(self, step_mode: bool = False):
-        """开始执行"""
-        print(f"⚡ [ExecutionManager] start_execution called with step_mode={step_mode}")
+    def start_execution(self, step_mode: bool = False, client_sid: str = None):
+        """开始执行；执行事件只发送给发起本次执行的客户端（client_sid 为空时广播）"""
+        logger.debug("⚡ [ExecutionManager] start_execution called with step_mode=%s", step_mode)
         if not self.current_execution:
-            print("⚡ [ExecutionManager] No current execution context")
+            logger.debug("⚡ [ExecutionManager] No current execution context")
             return {'success': False, 'message': 'No code to execute'}
 
+        self.client_sid = client_sid
         self.is_running = True
         self.is_paused = False
+        self.stop_event.clear()
+        self._last_vars_sent = None
         self.step_mode = step_mode
-        print(f"⚡ [ExecutionManager] Set step_mode={self.step_mode}, is_running={self.is_running}")
-
+        logger.debug("⚡ [ExecutionManager] Set step_mode=%s, is_running=%s", self.step_mode, self.is_running)
+
+        # 步进模式和连续模式使用同一个执行线程：步进模式只是把步骤回调换成在新行处等待 step_next 的版本。
+        # 执行放在真正的系统线程中（而不是 start_background_task 的协程）：解释器是CPU密集的，
+        # 放进 eventlet 协程会在无延迟执行时独占事件循环；步进等待也因此只阻塞这个线程，
+        # step_next / pause / stop 等事件处理器只是短暂持有 state_changed 的锁并通知，不会排队等待
+        logger.debug("⚡ [ExecutionManager] Starting execution thread...")
+        self.execution_thread = threading.Thread(target=self._execute_code)
+        self.execution_thread.start()
         if step_mode:
-            # 步进模式：初始化步进迭代器并开始执行（会在第一步暂停）
-            print("⚡ [ExecutionManager] Creating step iterator for step mode...")
-            try:
-                self.step_iterator = self._create_step_iterator()
-                print("⚡ [ExecutionManager] Step iterator created, starting execution...")
-                self.step_iterator.start_execution()
-                print("⚡ [ExecutionManager] Step iterator start_execution called")
-                self._emit_execution_start()
-                print("⚡ [ExecutionManager] Step mode started successfully")
-                return {'success': True, 'message': 'Step mode started - click Step to continue'}
-            except Exception as e:
-                print(f"⚡ [ExecutionManager] ERROR creating step iterator: {e}")
-                print(f"⚡ [ExecutionManager] Exception type: {type(e).__name__}")
-                import traceback
-                print(f"⚡ [ExecutionManager] Traceback: {traceback.format_exc()}")
-                self.is_running = False
-                self.step_mode = False
-                return {'success': False, 'message': f'Failed to start step mode: {str(e)}'}
-        else:
-            # 正常模式：在新线程中连续执行
-            print("⚡ [ExecutionManager] Starting continuous execution thread...")
-            self.execution_thread = threading.Thread(target=self._execute_code)
-            self.execution_thread.start()
-            return {'success': True, 'message': 'Continuous execution started'}
+            return {'success': True, 'message': 'Step mode started - click Step to continue'}
+        return {'success': True, 'message': 'Continuous execution started'}
 
     def _execute_code(self):
         """执行代码的内部方法"""
@@ -127,19 +234,34 @@ class ExecutionManager:
             hook = self.current_execution['hook']
 
             # 设置hook的回调函数，让它可以发送实时更新
-            hook.emit_callback = self._emit_execution_step
+            if self.step_mode:
+                hook.emit_callback = self._make_step_callback(self._emit_execution_step)
+            else:
+                hook.emit_callback = self._emit_execution_step
 
             # 开始执行
             self._emit_execution_start()
-
-            # 执行AST
-            result = interpreter.execute(ast_tree)
+            self._send_next_step_now = True
+            if self.socketio and not self.step_mode:
+                self.socketio.start_background_task(self._flush_steps_periodically)
+
+            if self.current_execution.get('fast_mode') and not self.step_mode:
+                # 快速模式：字节码按源代码哈希缓存，重复运行无需重新编译
+                code = compile_source(self.current_execution['source_code'], ast_tree)
+                result = interpreter.execute_compiled(code, self.current_execution['parser_info']['line_count'])
+            elif self.current_execution.get('instrumented'):
+                # 插桩模式：逐语句记录步骤，但语句本身由CPython虚拟机执行
+                result = interpreter.execute_instrumented(compile_instrumented(self.current_execution['source_code']))
+            else:
+                # 执行AST
+                result = interpreter.execute(ast_tree)
 
             # 检查是否被停止
             if interpreter.should_stop:
-                print("Execution was stopped")
+                logger.debug("Execution was stopped")
+                self._flush_step_buffer()
                 if self.socketio:
-                    self.socketio.emit('execution_control', {
+                    self._emit('execution_control', {
                         'success': True,
                         'message': 'Execution stopped by user'
                     })
@@ -149,19 +271,20 @@ class ExecutionManager:
 
         except Exception as e:
             error_msg = str(e)
-            print(f"Execution error: {error_msg}")
+            logger.debug("Execution error: %s", error_msg)
 
             # 区分停止和错误
             if "Execution stopped" in error_msg:
+                self._flush_step_buffer()
                 if self.socketio:
-                    self.socketio.emit('execution_control', {
+                    self._emit('execution_control', {
                         'success': True,
                         'message': 'Execution stopped by user'
                     })
             else:
                 self._emit_execution_error(error_msg)
         finally:
-            print("Cleaning up execution state...")
+            logger.debug("Cleaning up execution state...")
             self.is_running = False
             self.is_paused = False
             if self.current_execution:
@@ -170,74 +293,126 @@ class ExecutionManager:
     def _emit_execution_start(self):
         """发送执行开始事件"""
         if self.socketio:
-            self.socketio.emit('execution_started', {
+            self._emit('execution_started', {
                 'message': 'Code execution started'
             })
 
     def _emit_execution_step(self, step_data):
         """发送执行步骤事件"""
-        print(f"Emitting execution step: line {step_data.get('line')}, variables: {len(step_data.get('variables', {}))}")
-        if self.socketio:
-            self.socketio.emit('execution_step', step_data)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Emitting execution step: line %s, variables: %d", step_data.get('line'), len(step_data.get('variables', {})))
+        if not self.socketio:
+            return
+
+        # 差异相对上一次编码的步骤计算，编码、入队和发送都在同一把锁内，保证客户端按编码顺序收到
+        with self._step_buffer_lock:
+            # 步进模式下用户在等待每一步，立即发送（总是带完整变量）
+            if self.step_mode:
+                self._emit('execution_step', self._encode_step_variables(step_data, keyframe=True))
+                return
+            self._step_buffer.append(self._encode_step_variables(step_data))
+            should_flush = self._send_next_step_now or (
+                len(self._step_buffer) >= STEP_BATCH_SIZE and
+                time.monotonic() - self._last_flush >= STEP_BATCH_INTERVAL)
+            self._send_next_step_now = False
+        if should_flush:
+            self._flush_step_buffer()
+
+    def _encode_step_variables(self, step_data, keyframe=False):
+        """把步骤中的完整变量替换为相对上次发送的差异 var_delta（不修改原步骤，原步骤仍保存在hook中）；
+        不带变量的事件（如遍历状态）不发送 variables，客户端保留当前变量"""
+        variables = step_data.get('variables')
+        if not variables:
+            encoded = dict(step_data)
+            encoded.pop('variables', None)
+            return encoded
+
+        last = self._last_vars_sent
+        self._last_vars_sent = variables
+        if keyframe or last is None or self._steps_since_keyframe >= VARIABLES_KEYFRAME_INTERVAL:
+            self._steps_since_keyframe = 0
+            return step_data
+        self._steps_since_keyframe += 1
+
+        delta = _variables_delta(last, variables)
+
+        encoded = dict(step_data)
+        del encoded['variables']
+        encoded['var_delta'] = delta
+        return encoded
+
+    def _flush_step_buffer(self):
+        """将缓冲的步骤事件合并为一条消息发送；取出和发送都在锁内完成，
+        执行线程和后台任务同时发送时批次仍按顺序到达，之后的完成/错误事件也不会抢在最后一批之前"""
+        with self._step_buffer_lock:
+            steps = self._step_buffer
+            self._step_buffer = []
+            if steps:
+                self._last_flush = time.monotonic()
+                if self.socketio:
+                    self._emit('execution_step_batch', {'steps': steps})
+
+    def _flush_steps_periodically(self):
+        """后台任务：执行期间每帧发送一次缓冲的步骤"""
+        while self.is_running:
+            self.socketio.sleep(STEP_BATCH_INTERVAL)
+            self._flush_step_buffer()
+        self._flush_step_buffer()
 
     def _emit_execution_complete(self, result, output):
         """发送执行完成事件"""
+        self._flush_step_buffer()
         if self.socketio:
-            self.socketio.emit('execution_completed', {
+            self._emit('execution_completed', {
                 'result': result,
                 'output': output,
-                'steps': self.current_execution['hook'].steps
+                'steps': _compact_history(self.current_execution['hook'].steps)
             })
 
     def _emit_execution_error(self, error_message):
         """发送执行错误事件"""
+        self._flush_step_buffer()
         if self.socketio:
-            self.socketio.emit('execution_error', {
+            self._emit('execution_error', {
                 'error': error_message
             })
 
     def pause_execution(self):
         """暂停执行"""
         if not self.is_running:
-            print("Cannot pause: No execution in progress")
+            logger.debug("Cannot pause: No execution in progress")
             return {'success': False, 'message': 'No execution in progress to pause'}
 
         if self.is_paused:
-            print("Execution is already paused")
+            logger.debug("Execution is already paused")
             return {'success': False, 'message': 'Execution is already paused'}
 
-        print("Pausing execution...")
+        logger.debug("Pausing execution...")
         self.is_paused = True
-        print(f"Pause state set: is_paused={self.is_paused}, is_running={self.is_running}")
+        logger.debug("Pause state set: is_paused=%s, is_running=%s", self.is_paused, self.is_running)
         return {'success': True, 'message': 'Execution paused'}
 
     def resume_execution(self):
         """恢复执行"""
         if not self.is_running:
-            print("Cannot resume: No execution in progress")
+            logger.debug("Cannot resume: No execution in progress")
             return {'success': False, 'message': 'No execution in progress to resume'}
 
         if not self.is_paused:
-            print("Execution is not paused, cannot resume")
+            logger.debug("Execution is not paused, cannot resume")
             return {'success': False, 'message': 'Execution is not paused'}
 
-        print("Resuming execution...")
+        logger.debug("Resuming execution...")
         self.is_paused = False
-        print(f"Resume state set: is_paused={self.is_paused}, is_running={self.is_running}")
+        logger.debug("Resume state set: is_paused=%s, is_running=%s", self.is_paused, self.is_running)
         return {'success': True, 'message': 'Execution resumed'}
 
     def stop_execution(self):
         """停止执行"""
-        print("Stopping execution...")
+        logger.debug("Stopping execution...")
         self.is_running = False
-        self.is_paused = False
-
-        # 强制终止执行线程
-        if self.execution_thread and self.execution_thread.is_alive():
-            print("Terminating execution thread...")
-            # 设置停止标志
-            if hasattr(self, 'step_wait_event'):
-                self.step_wait_event.set()  # 唤醒可能在等待的步进模式
+        self.stop_event.set()
+        self.is_paused = False  # 唤醒可能在暂停或步进中等待的执行线程
 
         # 清理当前执行状态
         if self.current_execution:
@@ -246,156 +421,56 @@ class ExecutionManager:
 
         return {'success': True, 'message': 'Execution stopped'}
 
-    def _create_step_iterator(self):
-        """创建单步执行迭代器"""
-        print("🔄 [ExecutionManager] _create_step_iterator method entered")
-        interpreter = self.current_execution['interpreter']
-        ast_tree = self.current_execution['ast_tree']
-        hook = self.current_execution['hook']
-        print(f"🔄 [ExecutionManager] Got interpreter: {bool(interpreter)}, ast_tree: {bool(ast_tree)}, hook: {bool(hook)}")
-
-        # 首先设置hook的正常回调函数（如果还没设置的话）
-        if not hasattr(hook, 'emit_callback') or hook.emit_callback is None:
-            print("🔄 [ExecutionManager] Setting hook emit_callback to _emit_execution_step")
-            hook.emit_callback = self._emit_execution_step
-
-        # 设置hook的回调函数，让它在每步后等待
-        original_callback = hook.emit_callback
-        print(f"🔄 [ExecutionManager] original_callback is: {original_callback}")
-        self.step_wait_event = threading.Event()
-
+    def _make_step_callback(self, original_callback):
+        """步进模式的步骤回调：发送步骤后在新行处等待 step_next（第一步直接显示）"""
         # 跟踪是否是第一步和上一步的行号
         self.is_first_step = True
         self.last_emitted_line = None
 
         def step_callback(step_data):
-            current_line = step_data.get('line')
-            print(f"🔄 [StepIterator] step_callback called with step_data line: {current_line}, node_type: {step_data.get('node_type')}")
-
-            # 在步进模式下，跳过重复的行号（但仍然更新变量）
-            should_emit_and_wait = True
-            if self.step_mode and self.is_running:
-                if current_line == self.last_emitted_line:
-                    print(f"🔄 [StepIterator] Skipping duplicate line {current_line} in step mode")
-                    should_emit_and_wait = False
-                else:
-                    self.last_emitted_line = current_line
-                    print(f"🔄 [StepIterator] New line {current_line}, will emit and wait")
+            # 跳过重复的行号（但仍然更新变量）
+            current_line = step_data['line']
+            new_line = current_line != self.last_emitted_line
+            if new_line:
+                self.last_emitted_line = current_line
 
             # 总是发送数据到前端（用于变量更新）
-            if original_callback:
-                print("🔄 [StepIterator] Calling original callback")
-                original_callback(step_data)
-
-            # 在步进模式下，只为新行号等待用户输入
-            if self.step_mode and self.is_running and should_emit_and_wait:
-                if self.is_first_step:
-                    print("🔄 [StepIterator] First step - displaying immediately without waiting")
-                    self.is_first_step = False
-                else:
-                    print(f"🔄 [StepIterator] Step mode active, waiting for step_next... (step_mode={self.step_mode}, is_running={self.is_running})")
-                    # 确保在等待前先清除事件状态
-                    self.step_wait_event.clear()
-                    print("🔄 [StepIterator] Event cleared, now waiting...")
-                    self.step_wait_event.wait()  # 等待step_next调用
-                    print("🔄 [StepIterator] Received step_next signal, continuing...")
-            else:
-                print(f"🔄 [StepIterator] Not waiting - step_mode={self.step_mode}, is_running={self.is_running}, should_emit_and_wait={should_emit_and_wait}")
-
-        hook.emit_callback = step_callback
-
-        class StepIterator:
-            def __init__(self, manager, interp, tree):
-                self.manager = manager
-                self.interpreter = interp
-                self.ast_tree = tree
-                self.completed = False
-                self.thread = None
-
-            def start_execution(self):
-                """开始执行（在线程中）"""
-                print("🔄 [StepIterator] start_execution called")
-                if not self.completed:
-                    print("🔄 [StepIterator] Creating execution thread...")
-                    self.thread = threading.Thread(target=self._execute_all)
-                    self.thread.start()
-                    print("🔄 [StepIterator] Execution thread started")
-                else:
-                    print("🔄 [StepIterator] Already completed, not starting")
-
-            def _execute_all(self):
-                """执行所有步骤（但会在每步后暂停）"""
-                print("🔄 [StepIterator] _execute_all thread started")
-                try:
-                    print("🔄 [StepIterator] Starting interpreter execution...")
-                    result = self.interpreter.execute(self.ast_tree)
-                    print("🔄 [StepIterator] Interpreter execution completed")
-                    self.completed = True
-
-                    # 检查是否被停止
-                    if self.interpreter.should_stop:
-                        print("Step execution was stopped")
-                        if self.manager.socketio:
-                            self.manager.socketio.emit('execution_control', {
-                                'success': True,
-                                'message': 'Step execution stopped by user'
-                            })
-                    else:
-                        # 发送完成事件
-                        print("🔄 [StepIterator] Emitting execution complete")
-                        self.manager._emit_execution_complete(result, self.interpreter.output_buffer)
+            original_callback(step_data)
 
-                except Exception as e:
-                    self.completed = True
-                    error_msg = str(e)
-                    print(f"🔄 [StepIterator] Step execution error: {error_msg}")
-
-                    # 区分停止和错误
-                    if "Execution stopped" in error_msg:
-                        if self.manager.socketio:
-                            self.manager.socketio.emit('execution_control', {
-                                'success': True,
-                                'message': 'Step execution stopped by user'
-                            })
-                    else:
-                        print("🔄 [StepIterator] Emitting error")
-                        self.manager._emit_execution_error(error_msg)
-                finally:
-                    print("🔄 [StepIterator] Cleaning up step execution...")
-                    self.manager.is_running = False
-                    if self.interpreter:
-                        self.interpreter.should_stop = False  # 重置标志
-
-        print("🔄 [ExecutionManager] Creating StepIterator instance...")
-        step_iterator = StepIterator(self, interpreter, ast_tree)
-        print("🔄 [ExecutionManager] StepIterator instance created, returning...")
-        return step_iterator
+            # 只为新行号等待用户输入，第一步直接显示
+            if not new_line or not self.is_running:
+                return
+            if self.is_first_step:
+                self.is_first_step = False
+                return
+            with self.state_changed:
+                # 等待前先清除之前的请求，停止执行时也会被唤醒
+                self._step_requested = False
+                self.state_changed.wait_for(lambda: self._step_requested or not self.is_running)
+
+        return step_callback
 
     def step_next(self):
         """单步执行下一步"""
-        print(f"🔄 [ExecutionManager] step_next called - current_execution: {bool(self.current_execution)}, step_mode: {self.step_mode}, is_running: {self.is_running}")
+        logger.debug("🔄 [ExecutionManager] step_next called - current_execution: %s, step_mode: %s, is_running: %s", bool(self.current_execution), self.step_mode, self.is_running)
 
         if not self.current_execution:
-            print("🔄 [ExecutionManager] No current execution context")
+            logger.debug("🔄 [ExecutionManager] No current execution context")
             return {'success': False, 'message': 'No execution in progress'}
 
         if not self.step_mode:
-            print("🔄 [ExecutionManager] Not in step mode")
+            logger.debug("🔄 [ExecutionManager] Not in step mode")
             return {'success': False, 'message': 'Not in step mode'}
 
         if not self.is_running:
-            print("🔄 [ExecutionManager] No execution in progress")
+            logger.debug("🔄 [ExecutionManager] No execution in progress")
             return {'success': False, 'message': 'No execution in progress'}
 
         # 触发继续执行下一步
-        if hasattr(self, 'step_wait_event') and self.step_wait_event:
-            print(f"🔄 [ExecutionManager] Triggering step_wait_event (is_set: {self.step_wait_event.is_set()})")
-            self.step_wait_event.set()
-            print("🔄 [ExecutionManager] step_wait_event.set() completed")
-            return {'success': True, 'message': 'Continuing to next step'}
-        else:
-            print("🔄 [ExecutionManager] Step mechanism not available")
-            return {'success': False, 'message': 'Step mechanism not available'}
+        with self.state_changed:
+            self._step_requested = True
+            self.state_changed.notify_all()
+        return {'success': True, 'message': 'Continuing to next step'}
 
     def get_current_state(self):
         """获取当前执行状态"""
@@ -417,17 +492,17 @@ class ExecutionManager:
 
     def set_execution_speed(self, delay: float):
         """设置执行速度"""
-        print(f"Setting execution delay to {delay:.2f} seconds")
+        logger.debug("Setting execution delay to %.2f seconds", delay)
 
         if self.current_execution:
             interpreter = self.current_execution['interpreter']
             interpreter.execution_delay = delay
-            print(f"Updated current interpreter delay to {delay:.2f}s")
+            logger.debug("Updated current interpreter delay to %.2fs", delay)
             return {'success': True, 'message': f'Execution speed set to {delay:.2f}s per step'}
         else:
             # Store for future executions
             self.default_execution_delay = delay
-            print(f"Stored default delay for future executions: {delay:.2f}s")
+            logger.debug("Stored default delay for future executions: %.2fs", delay)
             return {'success': True, 'message': f'Execution speed set to {delay:.2f}s per step (will apply to next execution)'}
 
 # 创建全局执行管理器实例
@@ -440,41 +515,48 @@ def setup_websocket_handlers(socketio: SocketIO):
     @socketio.on('connect')
     def handle_connect():
         """客户端连接"""
-        print('🔌 [WebSocket] Client connected - debug mode active - LATEST VERSION')
+        logger.debug('🔌 [WebSocket] Client connected')
         emit('connected', {'message': 'Connected to Python Visualizer'})
 
     @socketio.on('disconnect')
     def handle_disconnect():
         """客户端断开连接"""
-        print('Client disconnected - stopping any running execution')
+        logger.debug('Client disconnected')
+
+        # 只有发起当前执行的客户端断开时才停止执行并清理，其他标签页关闭不影响正在进行的执行
+        if execution_manager.client_sid != request.sid:
+            return
 
-        # 立即停止任何正在运行的执行
         if execution_manager.is_running:
-            print('Stopping execution due to client disconnect')
+            logger.debug('Stopping execution due to client disconnect')
             execution_manager.stop_execution()
 
         # 清理执行环境
         execution_manager.current_execution = None
-        execution_manager.step_iterator = None
+        execution_manager.client_sid = None
 
     @socketio.on('parse_code')
     def handle_parse_code(data):
         """解析代码"""
-        print('🔧 [WebSocket] Received parse_code request via WebSocket')
+        logger.debug('🔧 [WebSocket] Received parse_code request via WebSocket')
         source_code = data.get('source_code', '')
         inputs = data.get('inputs', '')
         step_mode = data.get('step_mode', False)
-        print(f'🔧 [WebSocket] Code length: {len(source_code)}, Inputs: {inputs}, Step mode: {step_mode}')
+        fast_mode = bool(data.get('fast_mode', False))
+        native_code = bool(data.get('native_code', False))
+        instrumented = bool(data.get('instrumented', False))
+        logger.debug('🔧 [WebSocket] Code length: %d, Inputs: %s, Step mode: %s', len(source_code), inputs, step_mode)
 
-        result = execution_manager.parse_code(source_code, inputs)
-        print(f'🔧 [WebSocket] Parse result: success={result.get("success")}')
+        result = execution_manager.parse_code(source_code, inputs, fast_mode=fast_mode, native_code=native_code,
+                                              instrumented=instrumented)
+        logger.debug('🔧 [WebSocket] Parse result: success=%s', result.get('success'))
 
         if result.get('success'):
             # 如果解析成功，根据模式开始执行
             if step_mode:
-                print("🔧 [WebSocket] Starting step mode execution...")
-                execution_result = execution_manager.start_execution(step_mode=True)
-                print(f"🔧 [WebSocket] Step mode start result: {execution_result}")
+                logger.debug("🔧 [WebSocket] Starting step mode execution...")
+                execution_result = execution_manager.start_execution(step_mode=True, client_sid=request.sid)
+                logger.debug("🔧 [WebSocket] Step mode start result: %s", execution_result)
             emit('code_parsed', {**result, 'step_mode': step_mode})
         else:
             emit('code_parsed', result)
@@ -483,7 +565,7 @@ def setup_websocket_handlers(socketio: SocketIO):
     def handle_start_execution(data):
         """开始执行"""
         step_mode = data.get('step_mode', False)
-        result = execution_manager.start_execution(step_mode)
+        result = execution_manager.start_execution(step_mode, client_sid=request.sid)
         emit('execution_control', result)
 
     @socketio.on('pause_execution')
@@ -507,9 +589,9 @@ def setup_websocket_handlers(socketio: SocketIO):
     @socketio.on('step_next')
     def handle_step_next():
         """单步执行"""
-        print('🔧 [WebSocket] Received step_next request')
+        logger.debug('🔧 [WebSocket] Received step_next request')
         result = execution_manager.step_next()
-        print(f'🔧 [WebSocket] Step next result: {result}')
+        logger.debug('🔧 [WebSocket] Step next result: %s', result)
         emit('execution_control', result)
 
     @socketio.on('get_state')
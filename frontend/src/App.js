@@ -10,6 +10,17 @@ import ValueAnimationOverlay from './components/ValueAnimationOverlay';
 
 const API_BASE = 'http://localhost:3002';
 
+// 应用服务端发送的变量差异：{作用域: {added, changed, removed}}
+const applyVariableDelta = (variables, delta) => {
+  const next = { ...variables };
+  Object.entries(delta).forEach(([scope, { added, changed, removed }]) => {
+    const scopeVars = { ...(next[scope] || {}), ...added, ...changed };
+    removed.forEach(name => delete scopeVars[name]);
+    next[scope] = scopeVars;
+  });
+  return next;
+};
+
 function App() {
   const [code, setCode] = useState('');
   const [variables, setVariables] = useState({});
@@ -60,10 +71,15 @@ function App() {
       });
     });
 
-    // 监听执行步骤事件（实时变量更新）
-    socketConnection.on('execution_step', (data) => {
+    // 处理单个执行步骤（实时变量更新）
+    const handleExecutionStep = (data) => {
       console.log('Execution step:', data);
-      setVariables(data.variables || {});
+      // 完整快照（关键帧）直接替换，差异在当前变量上应用；两者都没有时保留当前变量
+      if (data.variables) {
+        setVariables(data.variables);
+      } else if (data.var_delta) {
+        setVariables(prev => applyVariableDelta(prev, data.var_delta));
+      }
 
       // 检查是否包含动画数据
       if (data.animation) {
@@ -100,6 +116,14 @@ function App() {
         }
         return 'running'; // 连续模式保持运行
       });
+    };
+
+    // 监听执行步骤事件
+    socketConnection.on('execution_step', handleExecutionStep);
+
+    // 连续模式下的批量步骤事件，按顺序逐个处理
+    socketConnection.on('execution_step_batch', (batch) => {
+      (batch.steps || []).forEach(handleExecutionStep);
     });
 
     // 监听执行完成事件
@@ -11,7 +11,7 @@ if [ ! -d "venv" ]; then
 
     echo "📥 安装依赖..."
     source venv/bin/activate
-    pip install -r requirements.txt
+    pip install -r requirements-dev.txt
 fi
 
 # 激活虚拟环境
@@ -20,7 +20,7 @@ source venv/bin/activate
 
 # 运行测试
 echo "🧪 运行测试..."
-python3 tests/test_interpreter.py
+python3 -m pytest tests
 
 if [ $? -eq 0 ]; then
     echo "✅ 所有测试通过！"
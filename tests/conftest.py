@@ -0,0 +1,61 @@
+"""
+测试公共配置：后端模块路径和共享的测试用例
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加后端目录到路径最前面（只添加一次），保证导入的是后端模块
+BACKEND_DIR = str(Path(__file__).resolve().parent.parent / 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from ast_parser import ASTParser
+
+BASIC_CODE = """
+x = 5
+y = 3
+result = x + y
+print(f"Result: {result}")
+"""
+
+CONDITIONAL_CODE = """
+age = 20
+if age >= 18:
+    status = "adult"
+else:
+    status = "minor"
+print(f"Status: {status}")
+"""
+
+LOOP_CODE = """
+numbers = []
+for i in range(3):
+    numbers.append(i)
+print(f"Numbers: {numbers}")
+"""
+
+FUNCTION_CODE = """
+def add(x, y):
+    return x + y
+
+result = add(5, 3)
+print(f"Function result: {result}")
+"""
+
+# 用例名 -> (代码, 变量名, 执行后的期望值)
+EXECUTION_CASES = {
+    'basic_operations': (BASIC_CODE, 'result', 8),
+    'conditional_logic': (CONDITIONAL_CODE, 'status', 'adult'),
+    'loops': (LOOP_CODE, 'numbers', [0, 1, 2]),
+    'functions': (FUNCTION_CODE, 'result', 8),
+}
+
+@pytest.fixture(scope='session', params=list(EXECUTION_CASES))
+def execution_case(request):
+    """解析好的执行用例 (AST, 变量名, 期望值)，每个会话（进程）只解析一次"""
+    code, var, expected = EXECUTION_CASES[request.param]
+    parse_result = ASTParser().parse(code)
+    assert parse_result['success'], parse_result['message']
+    return parse_result['ast'], var, expected
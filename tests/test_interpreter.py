@@ -1,206 +1,272 @@
 """
 测试Python解释器功能
 """
-import sys
-import os
+import functools
+import threading
 
-# 添加后端目录到路径
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+from ast_parser import ASTParser, ExecutionHook, compile_instrumented, compile_source
+from interpreter import ExecutionError, PythonInterpreter
 
-from ast_parser import ASTParser, ExecutionHook
-from interpreter import PythonInterpreter
+@functools.lru_cache(maxsize=None)
+def _cached_parse(code):
+    """解析测试代码，同一段代码只解析一次（返回的结果只读）"""
+    return ASTParser().parse(code)
 
-def test_basic_operations():
-    """测试基本操作"""
-    print("Testing basic operations...")
+def _new_interpreter(**kwargs):
+    """创建一组新的执行钩子和解释器"""
+    hook = ExecutionHook()
+    return hook, PythonInterpreter(hook, **kwargs)
+
+def _find_var(interpreter, name):
+    """按变量名查找序列化后的变量记录，局部作用域优先，找不到时返回None"""
+    variables = interpreter.get_all_variables()
+    return variables['local'].get(name) or variables['global'].get(name)
+
+def test_executes(execution_case):
+    """测试基本操作、条件逻辑、循环和函数：执行后检查变量值"""
+    tree, var, expected = execution_case
+    hook, interpreter = _new_interpreter(execution_delay=0)
+    interpreter.execute(tree)
 
+    variable = _find_var(interpreter, var)
+    assert variable is not None, f"{var} not found"
+    assert variable['value'] == expected
+
+def test_parse_cache():
+    """测试解析缓存"""
     code = """
-x = 5
-y = 3
-result = x + y
-print(f"Result: {result}")
+total = 1
+total = total + 2
 """
 
-    # 解析代码
-    parser = ASTParser()
-    parse_result = parser.parse(code)
+    first = ASTParser().parse(code)
+    PythonInterpreter(ExecutionHook(), execution_delay=0).execute(first['ast'])
+    second = ASTParser().parse(code)
 
-    if not parse_result['success']:
-        print(f"Parse error: {parse_result['message']}")
-        return False
+    assert first['success'] and second['success']
+    assert second['ast'] is first['ast'], "AST was parsed again for identical source"
 
-    # 执行代码
-    hook = ExecutionHook()
-    interpreter = PythonInterpreter(hook)
+    # 再次运行时复用节点上缓存的编译结果
+    assign = second['ast'].body[1]
+    assert hasattr(assign.value, '_thunk') and hasattr(assign, '_anim_template'), \
+        "per-node execution caches were not kept"
 
-    try:
-        interpreter.execute(parse_result['ast'])
-        print("Basic operations test: PASSED")
-        return True
-    except Exception as e:
-        print(f"Basic operations test: FAILED - {e}")
-        return False
+def test_aug_assign():
+    """测试增量赋值：变量、下标和属性目标；列表 += 原地修改且下一步显示新内容"""
+    code = """
+class Counter:
+    def __init__(self):
+        self.count = 0
+
+c = Counter()
+c.count += 2
+n = 1
+n += 4
+d = {'k': 1}
+d['k'] *= 3
+items = [1]
+alias = items
+items += [2]
+done = True
+"""
+
+    parse_result = _cached_parse(code)
+    assert parse_result['success'], parse_result['message']
+
+    hook, interpreter = _new_interpreter(execution_delay=0)
+    interpreter.execute(parse_result['ast'])
 
-def test_conditional_logic():
-    """测试条件逻辑"""
-    print("Testing conditional logic...")
+    scope = interpreter.global_scope
+    assert scope['n'] == 5
+    assert scope['d'] == {'k': 3}
+    assert scope['c'].attributes['count'] == 2
+    assert scope['items'] == [1, 2] and scope['alias'] is scope['items']
 
+    # 执行 done = True 之前的步骤应显示列表的新内容，而不是缓存的旧序列化结果
+    last_step = hook.steps[-1]
+    assert last_step['line'] == 15
+    assert last_step['variables']['global']['items']['value'] == [1, 2]
+    assert last_step['variables']['global']['alias']['value'] == [1, 2]
+
+def test_bool_operands():
+    """测试 and/or 与Python一致，返回决定结果的那个操作数"""
     code = """
-age = 20
-if age >= 18:
-    status = "adult"
-else:
-    status = "minor"
-print(f"Status: {status}")
+def empty():
+    return ''
+
+x = [] or 'd'
+y = 0 and 1
+z = empty() or 'e'
+w = 'a' and empty()
 """
 
-    parser = ASTParser()
-    parse_result = parser.parse(code)
+    parse_result = _cached_parse(code)
+    assert parse_result['success'], parse_result['message']
+
+    hook, interpreter = _new_interpreter(execution_delay=0)
+    interpreter.execute(parse_result['ast'])
 
-    if not parse_result['success']:
-        print(f"Parse error: {parse_result['message']}")
-        return False
+    values = {name: interpreter.global_scope[name] for name in ('x', 'y', 'z', 'w')}
+    assert values == {'x': 'd', 'y': 0, 'z': 'e', 'w': ''}
 
+def test_iteration_context_reset():
+    """测试重置后按循环变量和容器名都查不到旧的循环上下文"""
     hook = ExecutionHook()
-    interpreter = PythonInterpreter(hook)
+    hook.push_iteration_context('items', 'item', 2)
+    assert hook.get_iteration_context('item') is not None
+    assert len(hook.get_container_contexts('items')) == 1
+
+    hook.clear_all_iteration_contexts()
+    assert hook.get_iteration_context('item') is None
+    assert hook.get_container_contexts('items') == []
+    assert hook.get_iteration_stack() == []
+
+def test_control_flow_source():
+    """测试控制流源代码截取：字符串中的 \\u2028、\\x0c 等字符不影响后续行的对应"""
+    code = "note = 'a\u2028b\x0cc'\nlimit = 3\nif limit > 2:\n    limit = 2\nfor ch in note:\n    pass\n"
+
+    parse_result = ASTParser().parse(code)
+    assert parse_result['success'], parse_result['message']
+
+    sources = [entry.get('condition') or entry.get('iter') for entry in parse_result['control_flow']]
+    assert sources == ['limit > 2', 'note']
+
+def test_line_info_line_breaks():
+    """测试按行号取源代码行：\\r 和 \\r\\n 换行与ast的行号一致"""
+    for code in ("a = 1\rb = 2\rc = a + b\r", "a = 1\r\nb = 2\r\nc = a + b\r\n"):
+        parser = ASTParser()
+        assert parser.parse(code)['success']
+        assert [parser.get_line_info(line)['content'] for line in (1, 2, 3)] == ['a = 1', 'b = 2', 'c = a + b']
+
+def test_fast_mode():
+    """测试快速模式（字节码执行）"""
+    code = """
+def square(n):
+    return n * n
 
-    try:
-        interpreter.execute(parse_result['ast'])
+total = 0
+for i in range(4):
+    total = total + square(i)
+print(f"Total: {total}")
+"""
+
+    parse_result = _cached_parse(code)
+    assert parse_result['success'], parse_result['message']
+
+    hook, interpreter = _new_interpreter(execution_delay=0)
+    interpreter.execute_compiled(compile_source(code, parse_result['ast']))
+
+    total_var = interpreter.get_all_variables()['global'].get('total')
+    assert total_var is not None and total_var['value'] == 14
+    assert interpreter.output_buffer == ['Total: 14']
+
+def _run_native(code, names):
+    """分别用解释执行和原生执行运行代码，返回 [(各变量值, 步骤数), ...]"""
+    parse_result = _cached_parse(code)
+    assert parse_result['success'], parse_result['message']
 
-        # 检查变量值
-        variables = interpreter.get_all_variables()
-        status_var = None
-        for name, value in variables.items():
-            if 'status' in name:
-                status_var = value
-                break
-
-        if status_var and status_var.get('value') == 'adult':
-            print("Conditional logic test: PASSED")
-            return True
-        else:
-            print(f"Conditional logic test: FAILED - Expected 'adult', got {status_var}")
-            return False
-
-    except Exception as e:
-        print(f"Conditional logic test: FAILED - {e}")
-        return False
-
-def test_loops():
-    """测试循环"""
-    print("Testing loops...")
+    results = []
+    for native_loops in (False, True):
+        hook, interpreter = _new_interpreter(execution_delay=0)
+        interpreter.native_loops = native_loops
+        interpreter.execute(parse_result['ast'])
+        results.append((tuple(interpreter.global_scope.get(name) for name in names), len(hook.steps)))
+    return results
 
+def test_native_loops():
+    """测试纯数值循环的原生执行"""
     code = """
-numbers = []
-for i in range(3):
-    numbers.append(i)
-print(f"Numbers: {numbers}")
+total = 0
+for i in range(100):
+    if i % 3 == 0:
+        total = total + i * 2
+    else:
+        total = total - 1
 """
 
-    parser = ASTParser()
-    parse_result = parser.parse(code)
+    interpreted, native = _run_native(code, ('total', 'i'))
+    assert interpreted[0] == native[0] == (3300, 99)
+    assert native[1] < interpreted[1]
 
-    if not parse_result['success']:
-        print(f"Parse error: {parse_result['message']}")
-        return False
+def test_native_functions():
+    """测试纯数值函数（含递归）的原生执行"""
+    code = """
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
 
-    hook = ExecutionHook()
-    interpreter = PythonInterpreter(hook)
+def label(n):
+    return str(n)
 
-    try:
-        interpreter.execute(parse_result['ast'])
+result = fib(15)
+text = label(result)
+"""
 
-        # 检查变量值
-        variables = interpreter.get_all_variables()
-        numbers_var = None
-        for name, value in variables.items():
-            if 'numbers' in name:
-                numbers_var = value
-                break
-
-        expected = [0, 1, 2]
-        if numbers_var and numbers_var.get('value') == expected:
-            print("Loops test: PASSED")
-            return True
-        else:
-            print(f"Loops test: FAILED - Expected {expected}, got {numbers_var}")
-            return False
-
-    except Exception as e:
-        print(f"Loops test: FAILED - {e}")
-        return False
-
-def test_functions():
-    """测试函数"""
-    print("Testing functions...")
+    interpreted, native = _run_native(code, ('result', 'text'))
+    assert interpreted[0] == native[0] == (610, '610')
+    assert native[1] < interpreted[1]
 
+def test_native_function_loops():
+    """测试含 for range 循环的纯数值函数的原生执行"""
     code = """
-def add(x, y):
-    return x + y
+def total_of(n):
+    total = 0
+    for i in range(n):
+        total = total + i
+    return total
 
-result = add(5, 3)
-print(f"Function result: {result}")
+result = total_of(5)
 """
 
-    parser = ASTParser()
-    parse_result = parser.parse(code)
+    interpreted, native = _run_native(code, ('result',))
+    assert interpreted[0] == native[0] == (10,)
+    assert native[1] < interpreted[1]
 
-    if not parse_result['success']:
-        print(f"Parse error: {parse_result['message']}")
-        return False
+def test_instrumented_mode():
+    """测试插桩模式（插桩后的字节码逐语句记录步骤）"""
+    code = """
+def square(n):
+    result = n * n
+    return result
 
-    hook = ExecutionHook()
-    interpreter = PythonInterpreter(hook)
+total = 0
+for i in range(3):
+    total = total + square(i)
+"""
 
-    try:
-        interpreter.execute(parse_result['ast'])
+    hook, interpreter = _new_interpreter(execution_delay=0)
+    interpreter.execute_instrumented(compile_instrumented(code))
+
+    total_var = interpreter.get_all_variables()['global'].get('total')
+    assert total_var is not None and total_var['value'] == 5
+    assert '__vis_hook__' not in interpreter.global_scope
+
+    local_steps = [step for step in hook.steps if step['variables']['local'].get('n')]
+    assert [step['line'] for step in local_steps[:2]] == [3, 4]
+
+    # 函数内的步骤带有调用栈，模块级的步骤没有
+    assert all(step['call_stack'] == ('square()',) for step in hook.steps if step['line'] in (3, 4))
+    assert all(step['call_stack'] == () for step in hook.steps if step['line'] in (6, 7, 8))
 
-        # 检查变量值
-        variables = interpreter.get_all_variables()
-        result_var = None
-        for name, value in variables.items():
-            if 'result' in name:
-                result_var = value
-                break
-
-        if result_var and result_var.get('value') == 8:
-            print("Functions test: PASSED")
-            return True
-        else:
-            print(f"Functions test: FAILED - Expected 8, got {result_var}")
-            return False
-
-    except Exception as e:
-        print(f"Functions test: FAILED - {e}")
-        return False
-
-def run_all_tests():
-    """运行所有测试"""
-    print("Running Python Visualizer Tests...\n")
-
-    tests = [
-        test_basic_operations,
-        test_conditional_logic,
-        test_loops,
-        test_functions
-    ]
-
-    passed = 0
-    total = len(tests)
-
-    for test in tests:
-        if test():
-            passed += 1
-        print()
-
-    print(f"Test Results: {passed}/{total} tests passed")
-
-    if passed == total:
-        print("All tests PASSED! ✅")
-        return True
+def test_instrumented_stop():
+    """测试插桩模式下循环体只有 pass 时也能停止"""
+    code = """
+for i in range(100000000):
+    pass
+"""
+
+    hook, interpreter = _new_interpreter(execution_delay=0)
+    timer = threading.Timer(0.05, setattr, (interpreter, 'should_stop', True))
+    timer.start()
+    try:
+        interpreter.execute_instrumented(compile_instrumented(code))
+    except ExecutionError:
+        pass
     else:
-        print("Some tests FAILED! ❌")
-        return False
+        raise AssertionError("loop was not stopped")
+    finally:
+        timer.cancel()
+
+    assert interpreter.global_scope['i'] < 100000000 - 1
 
-if __name__ == "__main__":
-    run_all_tests()
\ No newline at end of file